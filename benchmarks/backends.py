@@ -0,0 +1,78 @@
+"""
+Compares steady-state throughput of the exception capture backends on the examples/ programs.
+
+    python benchmarks/backends.py [--repeat N] [example.py ...]
+
+Every program is run N times without instrumentation, with bytecode rewriting (Instrumenter.insert_try_except)
+and with the interpreter hook (ExceptionHook). The repair loop is replaced with a counter that stops the program,
+so only the cost of running up to the first captured exception is measured.
+"""
+import argparse
+import contextlib
+import io
+import sys
+import time
+from pathlib import Path
+
+import runtimeapr.loop
+from runtimeapr import Instrumenter, ExceptionHook, RuntimeAPRFileMatcher, handler
+
+EXAMPLES_DIR = Path(__file__).resolve().parent.parent / 'examples'
+SKIP = ('infinite_loop.py', 'very_long_program.py')  # Never finish
+
+handled = 0
+
+
+class Handled(BaseException):
+    pass  # Not an Exception, so outer instrumented frames don't handle it again
+
+
+def count_exception(e: Exception):
+    global handled
+    handled += 1
+    raise Handled()
+
+
+def run(code, path: Path, repeat: int, hook: ExceptionHook = None):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            script_globals = {'__name__': '__main__', '__file__': str(path)}
+            handler.install(script_globals)
+            try:
+                if hook is not None:
+                    with hook:
+                        exec(code, script_globals)
+                else:
+                    exec(code, script_globals)
+            except (Exception, Handled):
+                pass  # Handled, or uncaught without instrumentation
+    return repeat / (time.perf_counter() - t0)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--repeat', type=int, default=200, help="number of runs of each program")
+    ap.add_argument('examples', nargs='*', type=Path, help="programs to run (default: examples/*.py)")
+    args = ap.parse_args()
+
+    runtimeapr.loop.except_handler = count_exception
+    examples = args.examples or [p for p in sorted(EXAMPLES_DIR.glob('*.py')) if p.name not in SKIP]
+
+    print(f"{'Program':<28}{'plain (runs/s)':>16}{'bytecode':>12}{'hook':>12}{'bytecode/hook':>16}")
+    for path in examples:
+        path = path.resolve()
+        code = compile(path.read_text(), str(path), 'exec')
+        file_matcher = RuntimeAPRFileMatcher()
+        file_matcher.addSource(path)
+
+        plain = run(code, path, args.repeat)
+        bytecode = run(Instrumenter().insert_try_except(code), path, args.repeat)
+        hook = run(code, path, args.repeat, ExceptionHook(file_matcher, count_exception))
+        print(f'{path.name:<28}{plain:>16.1f}{bytecode:>12.1f}{hook:>12.1f}{bytecode / hook:>16.2f}')
+
+    print(f'Exceptions handled: {handled}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
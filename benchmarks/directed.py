@@ -0,0 +1,123 @@
+"""
+Compares the number of fuzzing trials needed to reproduce the exceptions of the examples/ programs.
+
+    python benchmarks/directed.py [--seeds N] [--max-trials N] [example.py ...]
+
+Every program is run once to find the function and the line of its first exception, and the inputs of the first call
+of that function are recorded. Fuzzer then starts from those inputs with random seed selection, coverage-guided
+selection and directed (distance to the line of the exception) selection. The median number of trials until the
+exception is reproduced and the number of seeds that reproduced it are reported.
+"""
+import argparse
+import contextlib
+import io
+import random
+import statistics
+import sys
+from copy import deepcopy
+from pathlib import Path
+
+import runtimeapr.loop
+from runtimeapr.concolic.fuzzing import Fuzzer
+from runtimeapr.loop.repairutils import prune_default_global_var
+from runtimeapr.registry import lookup
+
+EXAMPLES_DIR = Path(__file__).resolve().parent.parent / 'examples'
+SKIP = ('infinite_loop.py', 'very_long_program.py')  # Never finish
+
+MODES = {
+    'random': dict(coverage=False, directed=False),
+    'coverage': dict(coverage=True, directed=False),
+    'directed': dict(coverage=True, directed=True),
+}
+
+
+def reraise(e: Exception):
+    raise e  # Some examples call except_handler themselves
+
+
+def find_crash(path: Path):
+    """
+    Runs the program and returns the crashed function, the inputs of its first call and the states at the crash.
+    """
+    code = compile(path.read_text(), str(path), 'exec')
+    first_calls = dict()  # code -> (args, globals) of the first call
+
+    def profile(frame, event, arg):
+        if event == 'call' and frame.f_code.co_filename == str(path) and frame.f_code not in first_calls:
+            co = frame.f_code
+            args = [frame.f_locals[name] for name in co.co_varnames[: co.co_argcount]]
+            try:
+                first_calls[co] = deepcopy((args, frame.f_globals))
+            except Exception:
+                pass  # Inputs can't be copied, the function can't be fuzzed
+
+    globals = {'__name__': '__main__', '__file__': str(path)}
+    sys.setprofile(profile)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            exec(code, globals)
+    except Exception as e:
+        exc = e
+    else:
+        return None
+    finally:
+        sys.setprofile(None)
+
+    tb = exc.__traceback__
+    while tb.tb_next is not None:
+        tb = tb.tb_next
+    frame = tb.tb_frame
+    if frame.f_code.co_filename != str(path) or frame.f_code not in first_calls:
+        return None  # Raised in a library or at module level
+
+    fn = lookup(frame.f_code, frame)
+    if fn is None:
+        return None
+    args, first_globals = first_calls[frame.f_code]
+    return fn, args, first_globals, dict(frame.f_locals), dict(frame.f_globals), exc, tb.tb_lineno
+
+
+def fuzz(crash, mode: str, seed: int, max_trials: int):
+    """Returns the number of trials to reproduce the exception, or None."""
+    fn, args, first_globals, crash_locals, crash_globals, exc, line = crash
+    random.seed(seed)
+    args, globals = deepcopy((args, first_globals))
+    fuzzer = Fuzzer(fn, args, {}, crash_locals, crash_globals, exc, line, jobs=1, fork=False, **MODES[mode])
+    # Start from the globals of the first call, not the ones left by the crash.
+    # The states of the crash to compare with were already taken by __init__.
+    fuzzer.global_vars = prune_default_global_var(fn, globals)
+    with contextlib.redirect_stdout(io.StringIO()):
+        found, _, _, trial = fuzzer.fuzz_trials(max_trials, verbose=False)
+    return trial if found is not None else None
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--seeds', type=int, default=10, help="number of random seeds of each mode")
+    ap.add_argument('--max-trials', type=int, default=200, help="trials of each run")
+    ap.add_argument('examples', nargs='*', type=Path, help="programs to run (default: examples/*.py)")
+    args = ap.parse_args()
+
+    runtimeapr.loop.except_handler = reraise
+    examples = args.examples or [p for p in sorted(EXAMPLES_DIR.glob('*.py')) if p.name not in SKIP]
+
+    print(f'{"Program":<28}' + ''.join(f'{mode + " (found)":>22}' for mode in MODES))
+    for path in examples:
+        path = path.resolve()
+        crash = find_crash(path)
+        if crash is None:
+            print(f'{path.name:<28}  no exception to reproduce')
+            continue
+
+        row = f'{path.name:<28}'
+        for mode in MODES:
+            trials = [fuzz(crash, mode, seed, args.max_trials) for seed in range(args.seeds)]
+            found = [t for t in trials if t is not None]
+            median = f'{statistics.median(found):.0f}' if found else '-'
+            row += f'{median + f" ({len(found)}/{args.seeds})":>22}'
+        print(row)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""
+Checks that snapshots of values holding concolic proxies have the bytes of the plain values.
+
+    python benchmarks/pickler.py [--repeat N]
+
+Every value is pickled with repairutils.dumps() once with its numbers, strings and booleans wrapped in
+zint/zfloat/zstr/zbool and once without. The bytes must be equal, since snapshots are compared by them.
+The time of both is printed, the first going through the Python pickler and the second through the C pickler.
+"""
+import argparse
+import sys
+import time
+
+import z3
+
+import runtimeapr.loop
+from runtimeapr.concolic.ConcolicTracer import zbool, zfloat, zint, zstr
+from runtimeapr.loop.repairutils import dumps
+
+
+class Point:
+    def __init__(self, x, y, label):
+        self.x = x
+        self.y = y
+        self.label = label
+
+
+def make_values(wrap):
+    i = lambda v: zint(None, z3.Int('i'), v) if wrap else v
+    f = lambda v: zfloat(None, z3.Real('f'), v) if wrap else v
+    s = lambda v: zstr(None, z3.String('s'), v) if wrap else v
+    b = lambda v: zbool((dict(), []), z3.Bool('b'), v) if wrap else v
+    shared = s('shared')
+    return {
+        'list': [i(5), i(300), i(-70000), i(2**40)],
+        'dict': {'a': i(1), 'b': f(2.5), 'c': s('text')},
+        'tuple': (i(1), (s('x'), f(-0.0))),
+        'set': {i(3)},
+        'bool': [b(True), b(False)],
+        'object': Point(i(1), f(1.5), s('p')),
+        'shared': [shared, shared],
+        'nested': [{'k': [i(n) for n in range(20)]} for _ in range(5)],
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--repeat', type=int, default=1000, help="number of snapshots of each value")
+    args = ap.parse_args()
+
+    proxies, plain = make_values(True), make_values(False)
+    failed = 0
+    print(f'{"Value":<12}{"equal":>8}{"proxies (us)":>16}{"plain (us)":>14}')
+    for name in plain:
+        equal = dumps(proxies[name]) == dumps(plain[name])
+        failed += not equal
+        times = []
+        for value in (proxies[name], plain[name]):
+            t0 = time.perf_counter()
+            for _ in range(args.repeat):
+                dumps(value)
+            times.append((time.perf_counter() - t0) / args.repeat * 1e6)
+        print(f'{name:<12}{str(equal):>8}{times[0]:>16.1f}{times[1]:>14.1f}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""
+Compares the path exploration strategies of concolic execution on the examples/ programs.
+
+    python benchmarks/strategies.py [--max-trials N] [example.py ...]
+
+Every program is run once to find the function and the states of its first exception, and the inputs of the first
+call of that function are recorded. RepairloopRunner.get_buggy_values() then starts from those inputs with each
+strategy, and the number of concolic executions (trials) until the states of the exception are matched and the
+number of solved paths are reported.
+
+The examples are shallow, so the strategies are also compared on branch_target() below, whose exception is raised
+under three nested branches after a loop and two independent branches. Concolic execution starts from zeros and the
+number of executions until the exception is raised and the number of solved paths are reported.
+"""
+import argparse
+import contextlib
+import inspect
+import io
+import os
+import sys
+from copy import deepcopy
+from pathlib import Path
+
+import z3
+
+import runtimeapr.loop
+from runtimeapr.concolic import ConcolicTracer, ConditionTree, ControlDependenceGraph, zint
+from runtimeapr.concolic.solver import SolverSession, get_model_values
+from runtimeapr.concolic.strategy import STRATEGIES, create_strategy
+from runtimeapr.loop.repairloop import RepairloopRunner
+from runtimeapr.loop.repairutils import BugInformation, SnapshotMemo, pickle_object, prune_default_global_var, prune_default_local_var
+from runtimeapr.sourceindex import get_index
+
+from directed import EXAMPLES_DIR, SKIP, find_crash, reraise
+
+
+class TrialLimit(Exception):
+    pass
+
+
+def branch_target(a, b, c, d):
+    x = 0
+    while a < 3:
+        a += 1
+    if b > 0:
+        x += 1
+    else:
+        x -= 1
+    if d > 0:
+        x += 1
+    if c > 5:
+        if a > 3:
+            if d == a + c:
+                raise ValueError(x)  # Target
+    return x
+
+
+TARGET_LINE = branch_target.__code__.co_firstlineno + 12
+
+
+def explore_target(strategy: str, max_executions: int):
+    """Returns the number of executions to raise the exception of branch_target (None if not raised) and of solved paths."""
+    names = list(inspect.signature(branch_target).parameters)
+    tree = ConditionTree(ControlDependenceGraph(branch_target).cfg, SolverSession())
+    path_strategy = create_strategy(strategy, tree, TARGET_LINE)
+    values = {name: 0 for name in names}
+    solved = 0
+    for execution in range(1, max_executions + 1):
+        with ConcolicTracer() as tracer:
+            try:
+                branch_target(*[zint.create(tracer.context, name, values[name]) for name in names])
+            except ValueError:
+                return execution, solved
+        # As RepairloopRunner.get_buggy_values()
+        tree.update_tree(tracer.path)
+        path_strategy.add_trace(tracer.path)
+        tree.update_unreachable_conds(TARGET_LINE)
+        while True:
+            path = path_strategy.get_path()
+            if path is None:
+                return None, solved
+            solved += 1
+            if tree.session.check(path) == z3.sat:
+                values.update(get_model_values(tree.session.model()))
+                break
+            tree.update_tree(path, executed=False)
+    return None, solved
+
+
+def explore(crash, strategy: str, max_trials: int):
+    """Returns the number of trials to match the states of the exception (None if not matched) and of solved paths."""
+    fn, args, first_globals, crash_locals, crash_globals, exc, line = crash
+    bug_info = BugInformation(line, fn.__name__, dict(crash_locals), dict(crash_globals))
+    memo = SnapshotMemo()
+    for name, obj in prune_default_local_var(fn, dict(crash_locals)).items():
+        _obj = pickle_object(fn, name, obj, pickled_ids=memo)
+        if _obj is not None:
+            bug_info.local_vars[name] = _obj
+    memo = SnapshotMemo()
+    for name, obj in prune_default_global_var(fn, dict(crash_globals)).items():
+        _obj = pickle_object(fn, name, obj, is_global=True, pickled_ids=memo)
+        if _obj is not None:
+            bug_info.global_vars[name] = _obj
+
+    index = get_index(fn.__code__.co_filename)
+    target_func = index.get_function(fn.__code__.co_firstlineno)
+    runner = RepairloopRunner(fn, deepcopy(args), {}, bug_info, target_func, index.get_source(target_func), strategy=strategy)
+    # Start from the globals of the first call, not the ones left by the crash
+    runner.global_vars = prune_default_global_var(fn, deepcopy(first_globals))
+    runner.trial = 0
+
+    solved = 0
+    get_z3_values = runner.get_z3_values
+    run_concolic = runner.run_concolic
+
+    def count_solved(path):
+        nonlocal solved
+        solved += 1
+        return get_z3_values(path)
+
+    def limit_trials(before_values):
+        if runner.trial > max_trials:
+            raise TrialLimit()
+        return run_concolic(before_values)
+
+    runner.get_z3_values = count_solved
+    runner.run_concolic = limit_trials
+    try:
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            runner.get_buggy_values()
+    except TrialLimit:
+        return None, solved
+    except Exception as e:
+        if isinstance(e, AssertionError) and 'Failed to negate' in str(e):
+            return None, solved  # All paths are tried
+        raise
+    return runner.trial, solved
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--max-trials', type=int, default=50, help="concolic executions of each run")
+    ap.add_argument('examples', nargs='*', type=Path, help="programs to run (default: examples/*.py)")
+    args = ap.parse_args()
+
+    os.environ.setdefault('OPENAI_API_KEY', 'unused')  # RepairloopRunner creates a client, no request is sent
+    runtimeapr.loop.except_handler = reraise
+    examples = args.examples or [p for p in sorted(EXAMPLES_DIR.glob('*.py')) if p.name not in SKIP]
+
+    print(f'{"Program":<28}' + ''.join(f'{name + " (solved)":>22}' for name in STRATEGIES))
+    row = f'{"branch_target()":<28}'
+    for name in STRATEGIES:
+        executions, solved = explore_target(name, args.max_trials)
+        row += f'{(str(executions) if executions is not None else "-") + f" ({solved})":>22}'
+    print(row)
+    for path in examples:
+        path = path.resolve()
+        crash = find_crash(path)
+        if crash is None:
+            print(f'{path.name:<28}  no exception to reproduce')
+            continue
+
+        row = f'{path.name:<28}'
+        for name in STRATEGIES:
+            try:
+                trials, solved = explore(crash, name, args.max_trials)
+            except Exception as e:
+                row += f'{type(e).__name__:>22}'
+                continue
+            row += f'{(str(trials) if trials is not None else "-") + f" ({solved})":>22}'
+        print(row)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,4 +2,6 @@ from .slipcover import Slipcover, VERSION
 from .importer import FileMatcher, ImportManager, wrap_pytest
 from .fuzz import wrap_function
 from .loader import RuntimeAPRLoader,RuntimeAPRMetaPathFinder,RuntimeAPRFileMatcher,RuntimeAPRImportManager
-from .instrumenter import Instrumenter
\ No newline at end of file
+from .instrumenter import Instrumenter
+from .codecache import CodeCache
+from .hook import ExceptionHook
\ No newline at end of file
@@ -18,8 +18,10 @@ import platform
 #
 import argparse
 
-from . import Instrumenter, RuntimeAPRFileMatcher, RuntimeAPRImportManager
+from . import Instrumenter, RuntimeAPRFileMatcher, RuntimeAPRImportManager, CodeCache, ExceptionHook, handler, registry
 from .configure import Configure
+from . import loop  # Before .concolic, which imports it back through concolic.fuzzing
+from .concolic.strategy import STRATEGIES
 
 ap = argparse.ArgumentParser(prog='slipcover')
 ap.add_argument('--branch', action='store_true', help="measure both branch and line coverage")
@@ -52,6 +54,30 @@ ap.add_argument('--dont-wrap-pytest', action='store_true', help=argparse.SUPPRES
 # Custon options for RuntimeAPR
 ap.add_argument('--throw-exception', action='store_true', help="throw exception when an error is occured")
 ap.add_argument('--original-sc', action='store_true', help="run original slipcover instead of runtime apr")
+ap.add_argument('--cache-dir', type=Path, help="store instrumented code in this directory instead of __pycache__")
+ap.add_argument('--no-cache', action='store_true', help="do not cache instrumented code on disk")
+ap.add_argument('--lazy', action='store_true', help="instrument functions when they are first called instead of at import; the first call runs uninstrumented")
+ap.add_argument('--fuzz-jobs', type=int, default=1, metavar="N",
+                help="number of forked processes used to search inputs that reproduce an exception")
+ap.add_argument('--fork-exec', action='store_true',
+                help="run each fuzzing trial in a forked child instead of on a deep copy of its inputs")
+ap.add_argument('--fuzz-coverage', action='store_true',
+                help="select fuzzing seeds by the coverage of the target function instead of uniformly")
+ap.add_argument('--directed', action='store_true',
+                help="give more fuzzing energy to seeds whose coverage is closer to the line of the exception "
+                     "(implies --fuzz-coverage)")
+ap.add_argument('--corpus-dir', type=Path,
+                help="store inputs that reproduce exceptions in this directory and start from them in later runs; "
+                     "entries are unpickled, so only share it with trusted users")
+ap.add_argument('--solver-cache-dir', type=Path,
+                help="store results of path constraints in this directory as JSON and reuse them in later runs")
+ap.add_argument('--solver-jobs', type=int, default=1, metavar="N",
+                help="race hard path constraints in N forked solvers with different settings")
+ap.add_argument('--path-strategy', choices=sorted(STRATEGIES), default='dfs',
+                help="order in which concolic execution negates the branches of tried paths")
+ap.add_argument('--backend', choices=['bytecode', 'hook'], default='bytecode',
+                help="capture exceptions by rewriting bytecode or with an interpreter hook (sys.monitoring/sys.settrace); "
+                     "the hook only reports exceptions, which keep propagating")
 
 g = ap.add_mutually_exclusive_group(required=True)
 g.add_argument('-m', dest='module', nargs=1, help="run given module as __main__")
@@ -70,6 +96,16 @@ base_path = Path(args.script).resolve().parent if args.script else Path('.').res
 
 if args.debug:
     Configure.debug = True
+Configure.fuzz_jobs = args.fuzz_jobs
+Configure.fork_execution = args.fork_exec
+Configure.fuzz_coverage = args.fuzz_coverage or args.directed
+Configure.fuzz_directed = args.directed
+if args.corpus_dir is not None:
+    Configure.corpus_dir = args.corpus_dir
+if args.solver_cache_dir is not None:
+    Configure.solver_cache_dir = args.solver_cache_dir
+Configure.solver_jobs = args.solver_jobs
+Configure.path_strategy = args.path_strategy
 
 if args.original_sc:
     file_matcher = sc.FileMatcher()
@@ -97,7 +133,8 @@ if args.original_sc:
         disassemble=args.dis,
     )
 else:
-    sci = Instrumenter()
+    sci = Instrumenter(lazy=args.lazy)
+    code_cache = None if args.no_cache else CodeCache(args.cache_dir)
 
 
 if args.original_sc and not args.dont_wrap_pytest:
@@ -153,10 +190,18 @@ if args.script:
         code = sci.instrument(code)
         with sc.ImportManager(sci, file_matcher):
             exec(code, script_globals)
+    elif args.backend == 'hook':
+        if args.ignore_repair:
+            exec(code, script_globals)
+        else:
+            with ExceptionHook(file_matcher):
+                exec(code, script_globals)
     else:
         if not args.ignore_repair:
             code = sci.insert_try_except(code)
-        with RuntimeAPRImportManager(sci, file_matcher):
+            handler.install(script_globals)
+            registry.add_namespace(script_globals)
+        with RuntimeAPRImportManager(sci, file_matcher, cache=code_cache):
             exec(code, script_globals)
 
 else:
@@ -166,8 +211,13 @@ else:
     if args.original_sc:
         with sc.ImportManager(sci, file_matcher):
             runpy.run_module(*args.module, run_name='__main__', alter_sys=True)
+    elif args.ignore_repair:
+        runpy.run_module(*args.module, run_name='__main__', alter_sys=True)
+    elif args.backend == 'hook':
+        with ExceptionHook(file_matcher):
+            runpy.run_module(*args.module, run_name='__main__', alter_sys=True)
     else:
-        with RuntimeAPRImportManager(sci, file_matcher):
+        with RuntimeAPRImportManager(sci, file_matcher, cache=code_cache):
             runpy.run_module(*args.module, run_name='__main__', alter_sys=True)
 
 if args.original_sc and args.fail_under:
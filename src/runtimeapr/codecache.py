@@ -0,0 +1,107 @@
+import hashlib
+import importlib.util
+import marshal
+import os
+import sys
+import tempfile
+from pathlib import Path
+from types import CodeType
+from typing import Optional
+
+import bytecode
+
+from .instrumenter import Instrumenter
+from .slipcover import VERSION
+
+CACHE_MAGIC = b'RAPR'
+
+# Modules that shape the instrumented code, e.g. the names of the handler globals it loads and the lazy trampolines
+INSTRUMENTATION_SOURCES = ('instrumenter.py', 'lazy.py', 'handler.py')
+
+
+def get_instrumentation_version() -> str:
+    """
+    Hash of the sources of the instrumentation and of the versions of the bytecode package and the interpreter
+    that assemble it, so entries of older RuntimeAPR code or of another bytecode release are not used.
+    """
+    global instrumentation_version
+    if instrumentation_version is None:
+        digest = hashlib.sha256(VERSION.encode())
+        digest.update(bytecode.__version__.encode())
+        digest.update(sys.version.encode())
+        for name in INSTRUMENTATION_SOURCES:
+            digest.update((Path(__file__).parent / name).read_bytes())
+        instrumentation_version = digest.hexdigest()[:16]
+    return instrumentation_version
+
+
+instrumentation_version: Optional[str] = None
+
+
+class CodeCache:
+    """On-disk cache for code instrumented by Instrumenter.insert_try_except.
+
+    Like __pycache__, entries are stored next to the source file unless a cache
+    directory is given.  An entry is only used if it was produced from the same
+    source, interpreter, instrumentation sources and instrumenter options.
+    """
+
+    def __init__(self, cache_dir: Optional[Path] = None):
+        self.cache_dir = Path(cache_dir).resolve() if cache_dir is not None else None
+
+    def get_path(self, origin: Path) -> Path:
+        name = f"{origin.stem}.{sys.implementation.cache_tag}.runtimeapr-{get_instrumentation_version()}.pyc"
+        if self.cache_dir is None:
+            return origin.parent / '__pycache__' / name
+
+        # modules with the same name may come from different directories
+        prefix = hashlib.sha1(str(origin.resolve()).encode()).hexdigest()[:16]
+        return self.cache_dir / f"{prefix}-{name}"
+
+    @staticmethod
+    def get_key(source: bytes, sci: Instrumenter) -> bytes:
+        key = hashlib.sha256()
+        key.update(importlib.util.source_hash(source))
+        key.update(sys.version.encode())
+        key.update(get_instrumentation_version().encode())
+        key.update(repr(sorted(sci.get_options().items())).encode())
+        return key.digest()
+
+    def load(self, origin: Path, key: bytes) -> Optional[CodeType]:
+        try:
+            data = self.get_path(origin).read_bytes()
+        except OSError:
+            return None
+
+        header = CACHE_MAGIC + key
+        if not data.startswith(header):
+            return None     # stale or foreign entry
+
+        try:
+            code = marshal.loads(data[len(header):])
+        except (EOFError, ValueError, TypeError):
+            return None
+
+        return code if isinstance(code, CodeType) else None
+
+    def store(self, origin: Path, key: bytes, code: CodeType) -> None:
+        try:
+            data = marshal.dumps(code)
+        except ValueError:
+            return      # code refers to objects marshal can't write
+
+        path = self.get_path(origin)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # write to a private file and rename it over the entry, so concurrent
+            # writers never expose a partially written entry to readers
+            fd, tmp_name = tempfile.mkstemp(prefix=path.name + '.', suffix='.tmp', dir=path.parent)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(CACHE_MAGIC + key + data)
+                os.replace(tmp_name, path)
+            except BaseException:
+                os.unlink(tmp_name)
+                raise
+        except OSError:
+            pass        # caching is best effort; read-only source trees are fine
@@ -32,6 +32,7 @@ import z3
 import inspect
 import string
 
+
 class ConcolicTracer:
     """Trace function execution, tracking variables and path conditions"""
 
@@ -94,36 +95,6 @@ class ConcolicTracer:
             self.fn_args[name] = vname
         return my_args
 
-    def zeval(self, predicates=None, *,python=False, log=False):
-        """Evaluate `predicates` in current context.
-        - If `python` is set, use the z3 Python API; otherwise use z3 standalone.
-        - If `log` is set, show input to z3.
-        Return a pair (`result`, `solution`) where
-        - `result` is either `'sat'` (satisfiable); then 
-           solution` is a mapping of variables to (value, type) pairs; or
-        - `result` is not `'sat'`, indicating an error; then `solution` is `None`
-        """
-        if predicates is None:
-            path = self.path
-        else:
-            path = list(self.path)
-            for i in sorted(predicates):
-                if len(path) > i:
-                    path[i] = predicates[i]
-                else:
-                    path.append(predicates[i])
-        if log:
-            print('Predicates in path:')
-            for i, p in enumerate(path):
-                print(i, p)
-            print()
-
-        r, sol = (zeval_py if python else zeval_smt)(path, self, log)
-        if r == 'sat':
-            return r, {k: sol.get(self.fn_args[k], None) for k in self.fn_args}
-        else:
-            return r, None
-
 def zproxy_create(cls, z_type, z3var, context, z_name, v=None):
     z_value = cls(context, z3var(z_name), v)
     context[0][z_name] = z_type  # add to decls
@@ -155,6 +126,7 @@ class zbool:
             current_frame=frames[cur_index]
 
         pred.cond_lineno=current_frame.lineno
+        pred.cond_polarity=r  # Branch taken, the condition itself may be a Not
         self.path.append(pred)
         return r
     
@@ -410,100 +382,7 @@ def reset_counter():
     COUNTER = 0
 
 
-def zeval_py(path, cc, log):
-    for decl in cc.decls:
-        if cc.decls[decl] == 'BitVec':
-            v = "z3.%s('%s', 8)" % (cc.decls[decl], decl)
-        else:
-            v = "z3.%s('%s')" % (cc.decls[decl], decl)
-        exec(v)
-    s = z3.Solver()
-    s.add(z3.And(path))
-    if s.check() == z3.unsat:
-        return 'No Solutions', {}
-    elif s.check() == z3.unknown:
-        return 'Gave up', None
-    assert s.check() == z3.sat
-    m = s.model()
-    return 'sat', {d.name(): m[d] for d in m.decls()}
-
-import re
-
-import subprocess
-
-SEXPR_TOKEN = r'''(?mx)
-    \s*(?:
-        (?P<bra>\()|
-        (?P<ket>\))|
-        (?P<token>[^"()\s]+)|
-        (?P<string>"[^"]*")
-       )'''
-
-def parse_sexp(sexp):
-    stack, res = [], []
-    for elements in re.finditer(SEXPR_TOKEN, sexp):
-        kind, value = [(t, v) for t, v in elements.groupdict().items() if v][0]
-        if kind == 'bra':
-            stack.append(res)
-            res = []
-        elif kind == 'ket':
-            last, res = res, stack.pop(-1)
-            res.append(last)
-        elif kind == 'token':
-            res.append(value)
-        elif kind == 'string':
-            res.append(value[1:-1])
-        else:
-            assert False
-    return res
-
-import tempfile
-import os
-
-Z3_BINARY = 'z3'  # Z3 binary to invoke
-
-Z3_OPTIONS = '-t:6000'  # Z3 options - a soft timeout of 6000 milliseconds
-
-def zeval_smt(path, cc, log):
-    s = cc.smt_expr(True, True, path)
-
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.smt',
-                                     delete=False) as f:
-        f.write(s + "\n")
-        f.write("(check-sat)\n")
-        f.write("(get-model)\n")
-
-    if log:
-        print(open(f.name).read())
-
-    cmd = f"{Z3_BINARY} {Z3_OPTIONS} {f.name}"
-    if log:
-        print(cmd)
-
-    output = subprocess.getoutput(cmd)
-
-    os.remove(f.name)
-
-    if log:
-        print(output)
-
-    o = parse_sexp(output)
-    if not o:
-        return 'Gave up', None
-
-    kind = o[0]
-    if kind == 'unknown':
-        return 'Gave up', None
-    elif kind == 'timeout':
-        return 'Timeout', None
-    elif kind == 'unsat':
-        return 'No Solutions', {}
-
-    assert kind == 'sat', kind
-    if o[1][0] == 'model': # up to 4.8.8.0
-        return 'sat', {i[1]: (i[-1], i[-2]) for i in o[1][1:]}
-    else:
-        return 'sat', {i[1]: (i[-1], i[-2]) for i in o[1][0:]}
+Z3_TIMEOUT = 6000  # Soft timeout of z3 in milliseconds
 
 class zstr(str):
     def __new__(cls, context, zn, v):
@@ -6,4 +6,5 @@ from .model import CFG,Block
 from .condtree import ConditionTree,ConditionNode
 from .defusegraph import DefUseGraph
 from .fuzzing import Fuzzer
+from .corpus import CorpusStore
 from .restoreStr import FunctionGenerator
\ No newline at end of file
@@ -31,7 +31,7 @@ from _ast import (
     ExceptHandler,
     IfExp,
 )  # type: ignore
-from py2cfg.model import Block, TryBlock, Link, CFG, FuncBlock
+from .model import Block, TryBlock, Link, CFG, FuncBlock
 
 
 def invert(
@@ -205,6 +205,30 @@ class CFGBuilder(ast.NodeVisitor):
             src = src_file.read()
             return self.build_from_src(name, src)
 
+    def build_from_function(
+        self, node: Union[FunctionDef, ast.AsyncFunctionDef], entry_id: int = 0
+    ) -> CFG:
+        """
+        Build the CFG of a single function definition, the same as the
+        function CFG built with the CFG of its module.
+
+        Args:
+            node: The AST node containing the function definition.
+            entry_id: Value for the id of the entry block of the CFG.
+
+        Returns:
+            The CFG produced from the body of the function.
+        """
+        cfg = self.build(
+            node.name,
+            ast.Module(body=node.body),
+            isinstance(node, ast.AsyncFunctionDef),
+            entry_id,
+        )
+        cfg.lineno = node.lineno
+        cfg.end_lineno = node.end_lineno  # type: ignore
+        return cfg
+
     # ---------- Graph management methods ---------- #
     def new_block(self, statement=None) -> Block:
         """
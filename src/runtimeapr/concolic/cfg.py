@@ -1,7 +1,9 @@
+import hashlib
 import inspect
-from typing import Dict, List, Set
+from typing import Dict, List, Optional, Set
 from .model import CFG,Block
 from .builder import CFGBuilder
+from ..sourceindex import FunctionNode,SourceIndex,get_index
 from types import CodeType, FunctionType, MethodType
 import z3
 import ast
@@ -36,12 +38,51 @@ def get_target_cfg(cfg:CFG,target_line:int,func_name:str) -> CFG:
     
     return cur_cfg
 
+def find_function_node(index:SourceIndex,first_line:int,func_name:str) -> Optional[FunctionNode]:
+    """
+    Find the definition of a function, nested functions included.
+    :param first_line: co_firstlineno of the function, the line of its first decorator if decorated
+    """
+    outer=index.get_function(first_line)
+    if outer is None:
+        return None
+    for node in ast.walk(outer):
+        if isinstance(node,(ast.FunctionDef,ast.AsyncFunctionDef)) and node.name==func_name:
+            node_line=node.decorator_list[0].lineno if len(node.decorator_list)!=0 else node.lineno
+            if node_line==first_line:
+                return node
+    return None
+
+def get_function_cfg(fn:FunctionType) -> CFG:
+    """
+    Get the CFG of a function, built from its definition once per version of its file.
+    CFGs are cached in the SourceIndex of the file (keyed by its path and mtime) with a hash of the function source,
+    so only the functions that are repaired are built.
+    The CFG is shared by every caller for the same function, so consumers must not mutate it, its blocks and links,
+    or the CompactCFG returned by its get_compact(); keep per-run state (e.g. unreachable blocks) outside of it.
+    Names are looked up by code.co_name, since fn.__name__ can be reassigned (e.g. by decorators).
+    """
+    code=fn.__code__
+    index=get_index(code.co_filename)
+    node=find_function_node(index,code.co_firstlineno,code.co_name)
+    if node is None:
+        # e.g. lambdas, search the CFG of the whole file
+        def build_file_cfg():
+            root_cfg=CFGBuilder().build('cfg',index.tree)
+            root_cfg.lineno=1
+            root_cfg.end_lineno=len(index.lines)
+            return root_cfg
+        root_cfg=index.get_cached('cfg',build_file_cfg)
+        return get_target_cfg(root_cfg,code.co_firstlineno,code.co_name)
+
+    source_hash=hashlib.sha1(index.get_source(node).encode()).hexdigest()
+    return index.get_cached(f'cfg:{node.lineno}:{node.name}:{source_hash}',lambda: CFGBuilder().build_from_function(node))
+
 class ControlDependenceGraph:
     def __init__(self,fn:FunctionType) -> None:
         self.entry_line=fn.__code__.co_firstlineno
-        root_cfg=CFGBuilder().build_from_file('cfg',fn.__code__.co_filename)
-        # Find the cfg of the function
-        self.cfg:CFG=get_target_cfg(root_cfg,self.entry_line,fn.__name__)
+        # Find the cfg of the function, shared by the graphs of the same function
+        self.cfg:CFG=get_function_cfg(fn)
         
         self.not_reachable_nodes=set()
         self.entry:Block=self.cfg.entryblock
@@ -1,11 +1,34 @@
 import ast
-from typing import List, Set
+from typing import List, Optional, Set, Tuple
 from .model import CFG,Block
+from .solver import SolverSession,get_path_key
 import z3
 import random
 
 __node_print_count__=0
 
+def get_polarity(cond:z3.BoolRef) -> bool:
+    """
+    Branch of a path condition, True for the true branch.
+    Recorded by zbool.__bool__ and negate_condition(), otherwise negated conditions are false branches.
+    """
+    polarity=getattr(cond,'cond_polarity',None)
+    if polarity is None:
+        polarity=not z3.is_not(cond)
+    return polarity
+
+def negate_condition(cond:z3.BoolRef) -> z3.BoolRef:
+    """Condition of the other branch of cond."""
+    polarity=get_polarity(cond)
+    if not polarity and z3.is_not(cond):
+        negated=cond.arg(0)
+    else:
+        negated=z3.Not(cond)
+    negated.cond_polarity=not polarity
+    if hasattr(cond,'cond_lineno'):
+        negated.cond_lineno=cond.cond_lineno
+    return negated
+
 class ConditionNode:
     def __init__(self,lineno:int,condition:z3.BoolRef,parent_node:Block=None,child_node:Block=None) -> None:
         self.lineno=lineno
@@ -15,6 +38,7 @@ class ConditionNode:
         self.parent_node:Block=parent_node
         self.child_node:Block=child_node
         self.reachable:bool=True
+        self.exhausted:bool=False # No path to select in this subtree, until new paths are added below
     
     def __eq__(self, __value: object) -> bool:
         return self.lineno==__value.lineno and self.condition==__value.condition
@@ -45,184 +69,159 @@ class ConditionNode:
         return s
 
 class ConditionTree:
-    def __init__(self,cfg:CFG) -> None:
+    def __init__(self,cfg:CFG,session:SolverSession=None) -> None:
         self.cfg=cfg
-        self.true_entry:ConditionNode=None
-        self.false_entry:ConditionNode=None
+        self.session=session # If given, skip subtrees whose prefix is known to be unsat
+        # Virtual node before the first condition, its children are the entries
+        self.root:ConditionNode=ConditionNode(cfg.entryblock.at(),None,None,cfg.entryblock)
+        self.covered:Set[int]=set() # ids of the blocks entered by executed paths
 
-    def __visit_to_update(self,node:ConditionNode,cfg_node:Block,conditions:List[z3.BoolRef],cond_index:int):
-        # Last statement of the block should be branch statement
-        if isinstance(cfg_node.statements[-1],ast.If) or isinstance(cfg_node.statements[-1],ast.While) or \
-                isinstance(cfg_node.statements[-1],ast.IfExp):
-            next_cond=conditions[cond_index]
+    @property
+    def true_entry(self) -> ConditionNode:
+        return self.root.true_child
 
-            if not str(next_cond).startswith('Not'):
-                # True branch
-                if node.true_child is None:
-                    node.true_child=ConditionNode(cfg_node.exits[0].target.at(),next_cond,cfg_node,cfg_node.exits[0].target)
-                self.__visit_to_update(node.true_child,cfg_node.exits[0].target,conditions,cond_index+1)
-            else:
-                # False branch
-                if node.false_child is None:
-                    # Only one branch exist if false branch is function end
-                    if len(cfg_node.exits)>=2:
-                        node.false_child=ConditionNode(cfg_node.exits[1].target.at(),next_cond,cfg_node,cfg_node.exits[1].target)
-                    else:
-                        node.false_child=ConditionNode(-1,next_cond,cfg_node)
-                if len(cfg_node.exits)>=2:
-                    self.__visit_to_update(node.false_child,cfg_node.exits[1].target,conditions,cond_index+1)
-        elif isinstance(cfg_node.statements[-1],ast.For):
-            if cond_index<len(conditions):
-                next_cond=conditions[cond_index]
-                cond_lineno=next_cond.cond_lineno
-                if cfg_node.statements[-1].lineno<=cond_lineno<=cfg_node.statements[-1].end_lineno:
-                    # Go to body
-                    if node.true_child is None:
-                        # Create dummy node with None condition
-                        node.true_child=ConditionNode(cfg_node.exits[0].target.at(),None,cfg_node,cfg_node.exits[0].target)
-                    self.__visit_to_update(node.true_child,cfg_node.exits[0].target,conditions,cond_index)
-                else:
-                    # Exit for statement
-                    if node.false_child is None:
-                        if len(cfg_node.exits)>=2:
-                            node.false_child=ConditionNode(cfg_node.exits[1].target.at(),None,cfg_node,cfg_node.exits[1].target)
-                        else:
-                            node.false_child=ConditionNode(-1,None,cfg_node)
-                    if len(cfg_node.exits)>=2:
-                        self.__visit_to_update(node.false_child,cfg_node.exits[1].target,conditions,cond_index)
-            elif len(cfg_node.exits)>2:
-                # No more condition: body not executed
-                self.__visit_to_update(node,cfg_node.exits[0].target,conditions,cond_index)
-        elif len(cfg_node.exits)>0:
-            self.__visit_to_update(node,cfg_node.exits[0].target,conditions,cond_index)
+    @property
+    def false_entry(self) -> ConditionNode:
+        return self.root.false_child
 
-    def update_tree(self,conditions:List[z3.BoolRef]):
-        current_cfg_node:Block=self.cfg.entryblock
-        current_cond:z3.BoolRef=conditions[0]
+    def __visit_to_update(self,node:ConditionNode,cfg_node:Block,conditions:List[z3.BoolRef],cond_index:int,executed:bool):
+        # Blocks visited without consuming a condition, to stop at loops without conditions
+        visited:Set[Tuple[int,int]]=set()
         while True:
+            # New paths may be added below this node
+            node.exhausted=False
+            if (cfg_node.id,cond_index) in visited:
+                return
+            visited.add((cfg_node.id,cond_index))
+            if executed:
+                self.covered.add(cfg_node.id)
+
             # Last statement of the block should be branch statement
-            if isinstance(current_cfg_node.statements[-1],ast.If) or isinstance(current_cfg_node.statements[-1],ast.While) or \
-                    isinstance(current_cfg_node.statements[-1],ast.IfExp):
-                if not str(current_cond).startswith('Not'):
+            if isinstance(cfg_node.statements[-1],ast.If) or isinstance(cfg_node.statements[-1],ast.While) or \
+                    isinstance(cfg_node.statements[-1],ast.IfExp):
+                if cond_index>=len(conditions):
+                    return
+                next_cond=conditions[cond_index]
+
+                if get_polarity(next_cond):
                     # True branch
-                    if self.true_entry is None:
-                        self.true_entry=ConditionNode(current_cfg_node.exits[0].target.at(),current_cond,current_cfg_node,current_cfg_node.exits[0].target)
-                    self.__visit_to_update(self.true_entry,current_cfg_node.exits[0].target,conditions,1)
-                    break
+                    if node.true_child is None:
+                        node.true_child=ConditionNode(cfg_node.exits[0].target.at(),next_cond,cfg_node,cfg_node.exits[0].target)
+                    node,cfg_node,cond_index=node.true_child,cfg_node.exits[0].target,cond_index+1
                 else:
                     # False branch
-                    if self.false_entry is None:
-                        if len(current_cfg_node.exits)>=2:
-                            self.false_entry=ConditionNode(current_cfg_node.exits[1].target.at(),current_cond,current_cfg_node,current_cfg_node.exits[1].target)
+                    if node.false_child is None:
+                        # Only one branch exist if false branch is function end
+                        if len(cfg_node.exits)>=2:
+                            node.false_child=ConditionNode(cfg_node.exits[1].target.at(),next_cond,cfg_node,cfg_node.exits[1].target)
                         else:
-                            self.false_entry=ConditionNode(-1,current_cond,current_cfg_node)
-                    if len(current_cfg_node.exits)>=2:
-                        self.__visit_to_update(self.false_entry,current_cfg_node.exits[1].target,conditions,1)
-                    break
-            elif isinstance(current_cfg_node.statements[-1],ast.For):
-                cond_lineno=current_cond.cond_lineno
-                if current_cfg_node.statements[-1].lineno<=cond_lineno<=current_cfg_node.statements[-1].end_lineno:
-                    # Go to body
-                    if self.true_entry is None:
-                        # Create dummy node with None condition
-                        self.true_entry=ConditionNode(current_cfg_node.exits[0].target.at(),None,current_cfg_node,current_cfg_node.exits[0].target)
-                    self.__visit_to_update(self.true_entry,current_cfg_node.exits[0].target,conditions,0)
-                    break
+                            node.false_child=ConditionNode(-1,next_cond,cfg_node)
+                    if len(cfg_node.exits)<2:
+                        return
+                    node,cfg_node,cond_index=node.false_child,cfg_node.exits[1].target,cond_index+1
+            elif isinstance(cfg_node.statements[-1],ast.For):
+                if cond_index<len(conditions):
+                    next_cond=conditions[cond_index]
+                    cond_lineno=next_cond.cond_lineno
+                    if cfg_node.statements[-1].lineno<=cond_lineno<=cfg_node.statements[-1].end_lineno:
+                        # Go to body
+                        if node.true_child is None:
+                            # Create dummy node with None condition
+                            node.true_child=ConditionNode(cfg_node.exits[0].target.at(),None,cfg_node,cfg_node.exits[0].target)
+                        node,cfg_node=node.true_child,cfg_node.exits[0].target
+                    else:
+                        # Exit for statement
+                        if node.false_child is None:
+                            if len(cfg_node.exits)>=2:
+                                node.false_child=ConditionNode(cfg_node.exits[1].target.at(),None,cfg_node,cfg_node.exits[1].target)
+                            else:
+                                node.false_child=ConditionNode(-1,None,cfg_node)
+                        if len(cfg_node.exits)<2:
+                            return
+                        node,cfg_node=node.false_child,cfg_node.exits[1].target
+                elif len(cfg_node.exits)>2:
+                    # No more condition: body not executed
+                    cfg_node=cfg_node.exits[0].target
                 else:
-                    # Exit for statement
-                    if self.false_entry is None:
-                        if len(current_cfg_node.exits)>=2:
-                            self.false_entry=ConditionNode(current_cfg_node.exits[1].target.at(),None,current_cfg_node,current_cfg_node.exits[1].target)
-                        else:
-                            self.false_entry=ConditionNode(-1,None,current_cfg_node)
-                    if len(current_cfg_node.exits)>=2:
-                        self.__visit_to_update(self.false_entry,current_cfg_node.exits[1].target,conditions,0)
-                    break
+                    return
+            elif len(cfg_node.exits)>0:
+                cfg_node=cfg_node.exits[0].target
             else:
-                current_cfg_node=current_cfg_node.exits[0].target
+                return
 
+    def update_tree(self,conditions:List[z3.BoolRef],executed:bool=True):
+        """
+        Add a path to the tree.
+        :param executed: False if the path is not solvable, so its blocks are not covered
+        """
+        self.__visit_to_update(self.root,self.cfg.entryblock,conditions,0,executed)
+    
     def __visit_path_dfs(self,node:ConditionNode,paths:List[z3.BoolRef]):
-        if (node.true_child is None and node.false_child is None) or \
-            (node.true_child is not None and node.false_child is not None and not node.true_child.reachable and not node.false_child.reachable):
-            # We already tried this path, select another path
-            return False
-        
-        if node.true_child is not None:
-            if node.true_child.reachable:
-                # Try to visit true branch
-                if node.true_child.condition is not None:
-                    paths.append(node.true_child.condition)
-                is_return=self.__visit_path_dfs(node.true_child,paths)
-                if is_return:
-                    # We found the path, stop searching
+        """
+        Appends the conditions of the first path in depth-first order that takes a branch not tried yet.
+        Subtrees without such a path are marked as exhausted and skipped by the next searches.
+        """
+        # [node, next branch to try (0: true, 1: false, 2: none), whether its condition is in paths]
+        stack:List[list]=[[node,0,False]]
+        # Ids of the conditions in paths. Prefixes are checked by the parents, so only the whole path is checked
+        key:List[int]=list(get_path_key(paths))
+        while len(stack)!=0:
+            frame=stack[-1]
+            node,branch,pushed=frame
+            if branch==0:
+                if node.exhausted or (self.session is not None and self.session.is_unsat(tuple(key))) or \
+                        (node.true_child is None and node.false_child is None) or \
+                        (node.true_child is not None and node.false_child is not None and not node.true_child.reachable and not node.false_child.reachable):
+                    # We already tried this path, or no path in this subtree is solvable
+                    branch=2
+                elif node.true_child is None:
+                    # Only false branch exist, select true branch
+                    if node.false_child.condition is not None:
+                        paths.append(negate_condition(node.false_child.condition))
                     return True
                 else:
-                    # We didn't find the path, remove the path
+                    frame[1]=1
+                    child=node.true_child
+                    if child.reachable and not child.exhausted:
+                        # Try to visit true branch
+                        if child.condition is not None:
+                            paths.append(child.condition)
+                            key.append(child.condition.get_id())
+                        stack.append([child,0,child.condition is not None])
+                    continue
+            if branch==1:
+                if node.false_child is None:
+                    # Only true branch exist, select false branch
                     if node.true_child.condition is not None:
-                        paths.pop()
-        else:
-            # Only false branch exist, select true branch
-            if node.false_child.condition is not None:
-                paths.append(node.false_child.condition.arg(0))
-            return True
-        
-        if node.false_child is None:
-            # Only true branch exist, select false branch
-            if node.true_child.condition is not None:
-                paths.append(z3.Not(node.true_child.condition))
-            return True
-        else:
-            if node.false_child.reachable:
-                # Try to visit false branch, if true branch is not the path or not exist
-                if node.false_child.condition is not None:
-                    paths.append(node.false_child.condition)
-                is_return=self.__visit_path_dfs(node.false_child,paths)
-                if is_return:
-                    # We found the path, stop searching
+                        paths.append(negate_condition(node.true_child.condition))
                     return True
-                else:
-                    # We didn't find the path, remove the path
-                    if node.false_child.condition is not None:
-                        paths.pop()
+                frame[1]=2
+                child=node.false_child
+                if child.reachable and not child.exhausted:
+                    # Try to visit false branch, if true branch is not the path or not exist
+                    if child.condition is not None:
+                        paths.append(child.condition)
+                        key.append(child.condition.get_id())
+                    stack.append([child,0,child.condition is not None])
+                continue
 
-        # We failed to find the path in this node :(
+            # We failed to find the path in this node :(
+            node.exhausted=True
+            stack.pop()
+            if pushed:
+                paths.pop()
+                key.pop()
         return False
 
-    def get_path(self) -> List[z3.BoolRef]:
+    def get_path(self) -> Optional[List[z3.BoolRef]]:
+        """
+        Path to solve next: a tried path with its last condition negated.
+        :return: conditions of the path, None if all paths are tried
+        """
         paths:List[z3.BoolRef]=[]
-        res=False
-        if self.true_entry is not None and self.true_entry.reachable:
-            # Try True branch first
-            if self.true_entry.condition is not None:
-                paths.append(self.true_entry.condition)
-            if self.__visit_path_dfs(self.true_entry,paths):
-                return paths
-        if self.true_entry is not None and self.false_entry is None:
-            # Only True branch exist, but unreachable
-            if self.true_entry.condition is not None:
-                return [z3.Not(self.true_entry.condition)]
-            else:
-                return []
-
-        if self.false_entry is not None and self.false_entry.reachable:
-            # Try False branch if True branch is none or failed to find path
-            if self.false_entry.condition is not None:
-                paths.append(self.false_entry.condition)
-            if self.__visit_path_dfs(self.false_entry,paths):
-                return paths
-        else:
-            # Only False branch exist, but unreachable
-            if self.false_entry.condition is not None:
-                return [self.false_entry.condition.arg(0)]
-            else:
-                return []
-                    
-        # True is none and failed to find path in false
-        assert self.true_entry is None,f'Both branches are None'
-        if self.false_entry.condition is not None:
-            return [self.false_entry.condition.arg(0)]
-        else:
-            return []
+        if self.__visit_path_dfs(self.root,paths):
+            return paths
+        return None
     
     def __visit_path_random(self,node:ConditionNode,paths:List[z3.BoolRef]):
         # TODO: Prevent duplicate path
@@ -283,47 +282,31 @@ class ConditionTree:
                 # Both are not exist or not reachable
                 return False
     
-    def __visit_to_check_reachable(self,node:Block,target_line:int,tried_nodes:Set[Block]=set()):
-        tried_nodes.add(node)
+    def __visit_to_check_reachable(self,node:Block,target_line:int):
         if node is None:
             return False
-        
-        if node.at()<=target_line<=node.end():
-            # Reached
-            return True
-        elif len(node.exits)==0:
-            # Not reachable until function exit
-            return False
-        else:
-            for child in node.exits:
-                if child.target not in tried_nodes:
-                    res=self.__visit_to_check_reachable(child.target,target_line,tried_nodes)
-                    if res:
-                        return True
-                    
-    def __visit_check_reachable(self,node:ConditionNode,target_line:int):
-        res=self.__visit_to_check_reachable(node.child_node,target_line)
-        if res:
-            # This node is reachable
-            if node.true_child is not None and node.true_child.reachable:
-                res=self.__visit_check_reachable(node.true_child,target_line)
-                if not res:
-                    # True branch is not reachable
-                    node.true_child.reachable=False
-            if node.false_child is not None and node.false_child.reachable:
-                res=self.__visit_check_reachable(node.false_child,target_line)
-                if not res:
-                    # False branch is not reachable
-                    node.false_child.reachable=False
-        else:
-            # This node is not reachable
-            node.reachable=False
+        # Reachability is computed once per CFG, each check is a lookup
+        compact=self.cfg.get_compact()
+        return compact.can_reach_line(compact.index[node.id],target_line)
 
-    def update_unreachable_conds(self,target_line:int) -> List[z3.BoolRef]:
-        if self.true_entry is not None:
-            self.__visit_check_reachable(self.true_entry,target_line)
-        if self.false_entry is not None:
-            self.__visit_check_reachable(self.false_entry,target_line)
+    def update_unreachable_conds(self,target_line:int) -> None:
+        """
+        Mark the branches whose blocks cannot reach target_line as unreachable, so they are not negated.
+        Nothing is marked if target_line is not in the CFG of the tree.
+        """
+        compact=self.cfg.get_compact()
+        if compact.get_line_mask(target_line)==0:
+            return
+        nodes:List[ConditionNode]=[entry for entry in (self.true_entry,self.false_entry) if entry is not None]
+        while len(nodes)!=0:
+            node=nodes.pop()
+            if not self.__visit_to_check_reachable(node.child_node,target_line):
+                # This node is not reachable
+                node.reachable=False
+                continue
+            for child in (node.true_child,node.false_child):
+                if child is not None and child.reachable:
+                    nodes.append(child)
     
     def __str__(self) -> str:
         s=''
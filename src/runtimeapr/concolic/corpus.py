@@ -0,0 +1,170 @@
+import hashlib
+import os
+import pickle
+import stat
+import tempfile
+import time
+import zlib
+from pathlib import Path
+from types import FunctionType
+from typing import Dict, List, Optional, Tuple
+
+from ..sourceindex import get_index
+
+CORPUS_MAGIC = b'RAPC'
+CORPUS_SUFFIX = '.corpus'
+
+Inputs = Tuple[List[object], Dict[str, object], Dict[str, object]]
+"""args, kwargs and globals of a call"""
+
+
+def is_trusted(path: Path) -> bool:
+    """
+    True if path and its directory are owned by the current user (or root) and not writable by others,
+    so no other user could have written the pickle in it. Always True where files have no owner.
+    """
+    if not hasattr(os, 'getuid'):
+        return True
+    for p in (path.parent, path):
+        st = p.stat()
+        if st.st_uid not in (os.getuid(), 0) or st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            return False
+    return True
+
+
+class CorpusStore:
+    """
+    On-disk store of the inputs that reproduced an exception, shared by the runs of a program.
+
+    Entries are keyed by the function (file, qualified name, hash of its source), the exception (type and line)
+    and the kind of inputs (inputs found by fuzzing or inputs that reproduce the exact states),
+    so a change of the function invalidates its entries.
+    Inputs are pickled and compressed, and entries not used for max_age seconds are evicted first,
+    then the least recently used ones until the store is smaller than max_size bytes.
+
+    Loading an entry unpickles it, which can run arbitrary code, so the directory must only be writable by
+    users trusted to run code as this one. The directory is created private, and entries in a directory
+    or file owned by another user or writable by group or others are not loaded.
+    """
+
+    MAX_INPUTS = 16  # Inputs kept in an entry, the latest ones
+
+    def __init__(self, directory: Path, max_age: float = 30 * 24 * 60 * 60, max_size: int = 64 * 1024 * 1024):
+        self.directory = Path(directory).resolve()
+        self.max_age = max_age
+        self.max_size = max_size
+
+    @staticmethod
+    def get_key(fn: FunctionType, exception: BaseException, excep_line: Optional[int] = None, kind='fuzz') -> str:
+        code = fn.__code__
+        if excep_line is None:
+            # Innermost line of the exception in the file of the function
+            tb = exception.__traceback__
+            while tb is not None:
+                if tb.tb_frame.f_code.co_filename == code.co_filename:
+                    excep_line = tb.tb_lineno
+                tb = tb.tb_next
+
+        key = hashlib.sha256()
+        key.update(code.co_filename.encode())
+        key.update(fn.__qualname__.encode())
+        try:
+            index = get_index(code.co_filename)
+            node = index.get_function(code.co_firstlineno)
+            source = index.get_source(node) if node is not None else index.source
+        except (OSError, SyntaxError, UnicodeDecodeError):
+            source = code.co_code.hex()  # No source, the bytecode changes with it
+        key.update(source.encode())
+        exc_type = type(exception)
+        key.update(f'{exc_type.__module__}.{exc_type.__qualname__}'.encode())
+        if excep_line is not None:
+            # Relative to the function, so unrelated edits above it don't invalidate the entry
+            key.update(str(excep_line - code.co_firstlineno).encode())
+        key.update(kind.encode())
+        return key.hexdigest()
+
+    def get_path(self, key: str) -> Path:
+        return self.directory / f'{key}{CORPUS_SUFFIX}'
+
+    def load(self, key: str) -> List[Inputs]:
+        path = self.get_path(key)
+        try:
+            if not is_trusted(path):
+                print(f'Corpus entry {path} may be written by another user, not loaded')
+                return []
+            data = path.read_bytes()
+            os.utime(path)  # Recently used, evicted last
+        except OSError:
+            return []
+
+        if not data.startswith(CORPUS_MAGIC):
+            return []
+        try:
+            inputs = pickle.loads(zlib.decompress(data[len(CORPUS_MAGIC) :]))
+        except Exception:
+            return []  # Corrupted, or classes of the inputs don't exist anymore
+        return inputs if isinstance(inputs, list) else []
+
+    def store(self, key: str, inputs: Inputs) -> bool:
+        """
+        Adds inputs to the entry of key.
+        :return: False if the inputs can't be pickled or written
+        """
+        try:
+            new_data = pickle.dumps(inputs, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return False
+
+        entries: List[Inputs] = []
+        for old_inputs in self.load(key):
+            try:
+                if pickle.dumps(old_inputs, pickle.HIGHEST_PROTOCOL) != new_data:
+                    entries.append(old_inputs)
+            except Exception:
+                pass
+        entries.append(inputs)
+        entries = entries[-self.MAX_INPUTS :]
+
+        path = self.get_path(key)
+        try:
+            data = CORPUS_MAGIC + zlib.compress(pickle.dumps(entries, pickle.HIGHEST_PROTOCOL))
+            path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+            # Write to a private file and rename it over the entry, so other runs never read a partial entry
+            fd, tmp_name = tempfile.mkstemp(prefix=path.name + '.', suffix='.tmp', dir=path.parent)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_name, path)
+            except BaseException:
+                os.unlink(tmp_name)
+                raise
+        except Exception:
+            return False
+
+        self.evict()
+        return True
+
+    def evict(self) -> None:
+        try:
+            paths = list(self.directory.glob(f'*{CORPUS_SUFFIX}'))
+        except OSError:
+            return
+
+        entries = []  # (mtime, size, path)
+        for path in paths:
+            try:
+                stat = path.stat()
+            except OSError:
+                continue  # Removed by another run
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        now = time.time()
+        total_size = sum(size for _, size, _ in entries)
+        for mtime, size, path in sorted(entries, key=lambda e: e[0]):
+            if now - mtime <= self.max_age and total_size <= self.max_size:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total_size -= size
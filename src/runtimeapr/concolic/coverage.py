@@ -0,0 +1,68 @@
+import dis
+from types import CodeType, FunctionType
+from typing import FrozenSet, Set, Tuple
+
+from .. import bytecode as bc
+
+Edge = Tuple[int, int]
+"""(previous line, line), the previous line is 0 at the entry of the function."""
+
+
+class LineCoverage:
+    """
+    Records the lines and the edges between lines executed by a function.
+
+    Line probes are inserted with the bytecode editor of Slipcover, but they call hit() of this object
+    instead of the probes of the C extension, so the coverage of each run is available right after the run.
+    The instrumented code is only installed while this object is used as a context manager.
+    """
+
+    def __init__(self, fn: FunctionType):
+        self.fn = fn
+        self.orig_code: CodeType = fn.__code__
+        self.code: CodeType = self.instrument(self.orig_code)
+        self.lines: Set[int] = set()
+        self.edges: Set[Edge] = set()
+        self.prev_line = 0
+
+    def instrument(self, co: CodeType) -> CodeType:
+        ed = bc.Editor(co)
+
+        # Nested functions share the probes of this function
+        for i, c in enumerate(co.co_consts):
+            if isinstance(c, CodeType):
+                ed.set_const(i, self.instrument(c))
+
+        hit_index = ed.add_const(self.hit)
+        delta = 0
+        for offset, lineno in dis.findlinestarts(co):
+            if lineno == 0:
+                continue  # Python 3.11.0b4 generates a 0th line
+
+            # Can't insert between an EXTENDED_ARG and the final opcode
+            if offset >= 2 and co.co_code[offset - 2] == bc.op_EXTENDED_ARG:
+                while offset < len(co.co_code) and co.co_code[offset - 2] == bc.op_EXTENDED_ARG:
+                    offset += 2
+
+            line_index = ed.add_const(lineno)
+            delta += ed.insert_function_call(offset + delta, hit_index, (line_index,))
+
+        return ed.finish()
+
+    def hit(self, lineno: int):
+        self.lines.add(lineno)
+        self.edges.add((self.prev_line, lineno))
+        self.prev_line = lineno
+
+    def get_edges(self) -> FrozenSet[Edge]:
+        return frozenset(self.edges)
+
+    def __enter__(self):
+        self.lines = set()
+        self.edges = set()
+        self.prev_line = 0
+        self.fn.__code__ = self.code
+        return self
+
+    def __exit__(self, *args):
+        self.fn.__code__ = self.orig_code
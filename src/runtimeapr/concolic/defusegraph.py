@@ -5,6 +5,7 @@ import gast as ast
 import beniget
 
 from ..configure import Configure
+from ..sourceindex import get_index
 
 
 class FunctionDefFinder(ast.NodeVisitor):
@@ -28,8 +29,8 @@ class FunctionDefFinder(ast.NodeVisitor):
 class DependencyGraph:
     def __init__(self, fn: FunctionType) -> None:
         filename = fn.__code__.co_filename
-        with open(filename, 'r') as f:
-            tree = ast.parse(f.read())
+        index = get_index(filename)
+        tree = index.gast_tree
         func_finder = FunctionDefFinder(fn.__name__, fn.__code__.co_firstlineno)
         func_finder.visit(tree)
         self.func_def = func_finder.definition
@@ -145,15 +146,18 @@ class DefUseGraph:
 
     def __init__(self, fn: FunctionType) -> None:
         filename = fn.__code__.co_filename
-        with open(filename, 'r') as f:
-            tree = ast.parse(f.read())
+        index = get_index(filename)
+        tree = index.gast_tree
         func_finder = FunctionDefFinder(fn.__name__, fn.__code__.co_firstlineno)
         func_finder.visit(tree)
         self.func_def = func_finder.definition
 
-        duc = beniget.DefUseChains(filename)
-        duc.visit(tree)
-        self.chains: dict = duc.chains
+        def get_chains():
+            duc = beniget.DefUseChains(filename)
+            duc.visit(tree)
+            return duc.chains
+
+        self.chains: dict = index.get_cached('def_use_chains', get_chains)
 
         self.bodies: List[DefUseGraph.Node] = []
         for define in self.chains:
@@ -0,0 +1,72 @@
+import ast
+from collections import deque
+from types import FunctionType
+from typing import Deque, Dict, Iterable, Optional
+
+from .cfg import ControlDependenceGraph
+from .model import CFG, Block
+
+COMPOUND_STATEMENTS = (
+    ast.If,
+    ast.For,
+    ast.AsyncFor,
+    ast.While,
+    ast.With,
+    ast.AsyncWith,
+    ast.Try,
+    ast.FunctionDef,
+    ast.AsyncFunctionDef,
+    ast.ClassDef,
+)
+
+
+class BlockDistance:
+    """
+    Distances (number of basic blocks) from the blocks of a function to the block of a target line,
+    used to direct fuzzing to the line of the exception.
+
+    Distances are computed once with a breadth-first search from the target block over the predecessors,
+    so blocks that can't reach the target have no distance.
+    """
+
+    def __init__(self, cfg: CFG, target_line: int):
+        self.cfg = cfg
+        self.target_line = target_line
+
+        self.line_blocks: Dict[int, Block] = dict()  # line -> block that contains the statement of the line
+        for block in cfg.own_blocks():
+            for stmt in block.statements:
+                if isinstance(stmt, COMPOUND_STATEMENTS):
+                    # Only the header, the body is in other blocks
+                    self.line_blocks[stmt.lineno] = block
+                else:
+                    for line in range(stmt.lineno, (getattr(stmt, 'end_lineno', None) or stmt.lineno) + 1):
+                        self.line_blocks[line] = block
+
+        self.target: Optional[Block] = self.line_blocks.get(target_line)
+        if self.target is None:
+            raise ValueError(f'No basic block at line {target_line} in {cfg.name}')
+
+        self.distances: Dict[int, int] = {self.target.id: 0}  # block id -> distance
+        to_visit: Deque[Block] = deque([self.target])
+        while to_visit:
+            block = to_visit.popleft()
+            for link in block.predecessors:
+                if link.source.id not in self.distances:
+                    self.distances[link.source.id] = self.distances[block.id] + 1
+                    to_visit.append(link.source)
+
+    @classmethod
+    def from_function(cls, fn: FunctionType, target_line: int) -> 'BlockDistance':
+        return cls(ControlDependenceGraph(fn).cfg, target_line)
+
+    def get_distance(self, line: int) -> Optional[int]:
+        block = self.line_blocks.get(line)
+        if block is None:
+            return None
+        return self.distances.get(block.id)
+
+    def get_min_distance(self, lines: Iterable[int]) -> Optional[int]:
+        """Distance of the block closest to the target among the blocks of lines, None if none can reach it."""
+        distances = [d for d in map(self.get_distance, lines) if d is not None]
+        return min(distances, default=None)
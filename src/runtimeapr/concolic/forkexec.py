@@ -0,0 +1,67 @@
+import os
+import pickle
+import sys
+from typing import Any, Callable, Dict
+
+FORK_FAILED = object()
+"""Returned by run_forked() if the child did not send back a result."""
+
+
+def can_fork() -> bool:
+    return hasattr(os, 'fork')
+
+
+def get_picklable(variables: Dict[str, Any]) -> Dict[str, Any]:
+    """The variables whose values can be pickled, e.g. to send them back from a forked child."""
+    picklable = dict()
+    for name, value in variables.items():
+        try:
+            pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            continue
+        picklable[name] = value
+    return picklable
+
+
+def run_forked(fn: Callable[[], Any]) -> Any:
+    """
+    Calls fn in a child forked from this process and sends its result back through a pipe.
+    The child works on copy-on-write pages of this process, so the inputs are not copied before the call
+    and nothing fn changes (arguments, globals of the function) is visible in this process.
+    :param fn: function without arguments, its result should be picklable
+    :return: result of fn, or FORK_FAILED if the child exited abnormally or the result can't be pickled
+    :raise OSError: if the child can't be forked, fn is not called
+    """
+    # Don't let the child flush the output buffered by the parent again
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # Child: never return to the caller, even on errors
+        os.close(read_fd)
+        status = 1
+        try:
+            data = pickle.dumps(fn(), pickle.HIGHEST_PROTOCOL)
+            with os.fdopen(write_fd, 'wb') as f:
+                f.write(data)
+            status = 0
+        except BaseException:
+            pass
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd, 'rb') as f:
+        data = f.read()
+    _, status = os.waitpid(pid, 0)
+    if status != 0 or len(data) == 0:
+        return FORK_FAILED
+
+    try:
+        return pickle.loads(data)
+    except Exception:
+        return FORK_FAILED
@@ -1,9 +1,14 @@
 from copy import copy, deepcopy
 import inspect
+import multiprocessing as mp
+import os
 import pickle
+import queue as queue_module
+import sys
+import time
 import traceback
 from types import FunctionType
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Counter, Dict, FrozenSet, List, Optional, Tuple
 import random
 import struct
 from enum import Enum
@@ -18,15 +23,21 @@ from ..loop.repairutils import (
     compare_object,
     is_default_global,
     is_default_local,
+    SnapshotMemo,
     pickle_object,
     prune_default_global_var,
     prune_default_local_var,
 )
 from .ConcolicTracer import ConcolicTracer, symbolize
+from .corpus import CorpusStore
+from .coverage import Edge, LineCoverage
+from .distance import BlockDistance
+from .forkexec import FORK_FAILED, can_fork, run_forked
 
 
 class Fuzzer:
     MAX_TRIALS = 500
+    PARALLEL_TIMEOUT = 600  # Seconds fuzz_parallel waits for its workers
 
     def __init__(
         self,
@@ -39,18 +50,71 @@ class Fuzzer:
         excep_line: int,
         *,
         skip_global=False,
+        jobs: Optional[int] = None,
+        fork: Optional[bool] = None,
+        coverage: Optional[bool] = None,
+        directed: Optional[bool] = None,
+        corpus_store: Optional[CorpusStore] = None,
     ) -> None:
         self.args = args
         self.kwargs = kwargs
         self.fn = fn
         self.skip_global = skip_global
+        self.jobs = jobs if jobs is not None else Configure.fuzz_jobs  # Number of forked workers of fuzz()
+        # Run each trial in a forked child instead of a deepcopy of the inputs
+        self.fork = (fork if fork is not None else Configure.fork_execution) and can_fork()
         self.local_vars = local_vars
         self.global_vars = global_vars
+        # Private generator, so workers and replays are seeded without touching the global random module
+        self.random = random.Random(random.getrandbits(64))
         self.exception = exception
         self.excep_line = excep_line
+        # Inputs that reproduced this exception in previous runs
+        if corpus_store is None and Configure.corpus_dir is not None:
+            corpus_store = CorpusStore(Configure.corpus_dir)
+        self.corpus_store = corpus_store
+
+        # Snapshots of the buggy state, taken once and compared with the state of every trial.
+        # The memo of each namespace is kept for the snapshots taken later by get_snapshot()
+        self.local_memo = SnapshotMemo()
+        self.global_memo = SnapshotMemo()
+        self.local_snapshots: Dict[str, PickledObject] = {
+            name: pickle_object(self.fn, name, obj, pickled_ids=self.local_memo)
+            for name, obj in self.local_vars.items()
+            if not is_default_local(self.fn, name, obj)
+        }
+        self.global_snapshots: Dict[str, PickledObject] = dict()
+        if not self.skip_global:
+            self.global_snapshots = {
+                name: pickle_object(self.fn, name, obj, is_global=True, pickled_ids=self.global_memo)
+                for name, obj in self.global_vars.items()
+                if not is_default_global(self.fn, name, obj)
+            }
 
         # self.def_use_graph:DefUseGraph=DefUseGraph(self.fn)
         self.corpus: List[Tuple[List[object], Dict[str, object], Dict[str, object]]] = []
+
+        # Coverage feedback: inputs are kept in the corpus only if they cover new edges or get closer to excep_line,
+        # and seeds that cover rare edges are selected more often
+        self.coverage: Optional[LineCoverage] = None
+        if coverage if coverage is not None else Configure.fuzz_coverage:
+            try:
+                self.coverage = LineCoverage(self.fn)
+            except Exception as e:
+                print(f'Cannot instrument {self.fn.__qualname__} for coverage, fuzz without coverage: {e}')
+        self.corpus_edges: List[FrozenSet[Edge]] = []  # Edges covered by each corpus entry
+        self.corpus_distances: List[Optional[int]] = []  # Distance to excep_line of each corpus entry
+        self.edge_counts: Counter[Edge] = Counter()  # Number of trials that covered each edge
+        self.best_distance: Optional[int] = None  # Closest distance between a covered line and excep_line
+
+        # Directed fuzzing: distances are counted in basic blocks of the CFG and seeds closer to excep_line
+        # get more energy. Otherwise distances are counted in lines and only used to keep inputs.
+        self.block_distance: Optional[BlockDistance] = None
+        if self.coverage is not None and (directed if directed is not None else Configure.fuzz_directed):
+            try:
+                self.block_distance = BlockDistance.from_function(self.fn, self.excep_line)
+            except Exception as e:
+                print(f'Cannot compute distances to line {self.excep_line}, fuzz without direction: {e}')
         self.candidate_vars: List[str] = []
 
         self.diffs = []
@@ -62,7 +126,7 @@ class Fuzzer:
                 candidates = []
                 for elem in obj.__class__:
                     candidates.append(elem)
-                index = random.randint(0, len(candidates) - 1)
+                index = self.random.randint(0, len(candidates) - 1)
                 return candidates[index]
 
             elif isinstance(obj, bool):
@@ -72,10 +136,10 @@ class Fuzzer:
 
             elif isinstance(obj, int):
                 # For integer object, flip a random bit
-                _r = random.randint(0, 2)
+                _r = self.random.randint(0, 2)
                 if _r == 0:
                     MAX_INT_BIT = 64
-                    bit = random.randint(0, MAX_INT_BIT - 1)
+                    bit = self.random.randint(0, MAX_INT_BIT - 1)
                     continue_mutate = False
                     return obj ^ (1 << bit)
                 elif _r == 1:
@@ -90,24 +154,24 @@ class Fuzzer:
                 MAX_STR_LEN = len(new_str)
 
                 # Erase random characters
-                while len(new_str) != 0 and random.randint(0, 1) == 1:
-                    index = random.randint(0, len(new_str) - 1)
+                while len(new_str) != 0 and self.random.randint(0, 1) == 1:
+                    index = self.random.randint(0, len(new_str) - 1)
                     new_str = new_str[:index] + new_str[index + 1 :]
 
                 # Insert random characters
-                while len(new_str) <= MAX_STR_LEN and random.randint(0, 1) == 1:
-                    index = random.randint(0, len(new_str))
-                    new_str = new_str[:index] + chr(random.randint(0, 255)) + new_str[index:]
+                while len(new_str) <= MAX_STR_LEN and self.random.randint(0, 1) == 1:
+                    index = self.random.randint(0, len(new_str))
+                    new_str = new_str[:index] + chr(self.random.randint(0, 255)) + new_str[index:]
 
                 if new_str != obj:
                     return new_str
 
                 if len(new_str) == 0:
-                    return chr(random.randint(0, 255))
+                    return chr(self.random.randint(0, 255))
                 else:
                     # Still the same string, mutate a random character
-                    index = random.randint(0, len(new_str) - 1)
-                    return new_str[:index] + chr(random.randint(0, 255)) + new_str[index + 1 :]
+                    index = self.random.randint(0, len(new_str) - 1)
+                    return new_str[:index] + chr(self.random.randint(0, 255)) + new_str[index + 1 :]
 
             elif isinstance(obj, bytes):
                 # For bytes object, erase/insert/mutate a random character
@@ -116,30 +180,30 @@ class Fuzzer:
                 MAX_STR_LEN = len(new_byte)
 
                 # Erase random characters
-                while len(new_byte) != 0 and random.randint(0, 1) == 1:
-                    index = random.randint(0, len(new_byte) - 1)
+                while len(new_byte) != 0 and self.random.randint(0, 1) == 1:
+                    index = self.random.randint(0, len(new_byte) - 1)
                     new_byte = new_byte[:index] + new_byte[index + 1 :]
 
                 # Insert random characters
-                while len(new_byte) <= MAX_STR_LEN and random.randint(0, 1) == 1:
-                    index = random.randint(0, len(new_byte))
-                    new_byte = new_byte[:index] + bytes(random.randint(0, 255)) + new_byte[index:]
+                while len(new_byte) <= MAX_STR_LEN and self.random.randint(0, 1) == 1:
+                    index = self.random.randint(0, len(new_byte))
+                    new_byte = new_byte[:index] + bytes(self.random.randint(0, 255)) + new_byte[index:]
 
                 if new_byte != obj:
                     return new_byte
 
                 if len(new_byte) == 0:
-                    return bytes(random.randint(0, 255))
+                    return bytes(self.random.randint(0, 255))
                 else:
                     # Still the same string, mutate a random character
-                    index = random.randint(0, len(new_byte) - 1)
-                    return new_byte[:index] + bytes(random.randint(0, 255)) + new_byte[index + 1 :]
+                    index = self.random.randint(0, len(new_byte) - 1)
+                    return new_byte[:index] + bytes(self.random.randint(0, 255)) + new_byte[index + 1 :]
 
             elif isinstance(obj, float):
                 # For float object, flip a random bitwise and bytewise
                 continue_mutate = False
                 binary = struct.pack('d', obj)
-                index = random.randint(0, 63)
+                index = self.random.randint(0, 63)
                 bytewise = index // 8
                 bitwise = index % 8
 
@@ -156,7 +220,7 @@ class Fuzzer:
                 if len(names) == 0:
                     continue_mutate = False
                     return obj
-                index = random.randint(0, len(names) - 1)
+                index = self.random.randint(0, len(names) - 1)
 
                 new_field = self.mutate_object(
                     getattr(obj, '__dict__')[name],
@@ -177,7 +241,7 @@ class Fuzzer:
         return False
 
     def mutate(self, local_diff: Optional[dict] = None, global_diff: Optional[dict] = None, *, verbose=True):
-        index = random.randint(0, len(self.corpus) - 1)
+        index = self.select_seed()
         selected_args, selected_kwargs, selected_global_vars = self.corpus[index]
         copy_args, copy_kwargs, copy_global_vars = deepcopy([selected_args, selected_kwargs, selected_global_vars])
 
@@ -190,7 +254,7 @@ class Fuzzer:
                     print('No mutatible args and kwargs, mutate global vars.')
                 change_global = True
             elif not self._args_mutatible(selected_args):
-                _rand = random.randint(0, 1)
+                _rand = self.random.randint(0, 1)
                 if _rand == 0:
                     if verbose:
                         print('No mutatible args, mutate global vars.')
@@ -200,7 +264,7 @@ class Fuzzer:
                         print('No mutatible args, mutate kwargs.')
                     change_kwargs = True
             elif not self._args_mutatible(list(selected_kwargs.values())):
-                _rand = random.randint(0, 1)
+                _rand = self.random.randint(0, 1)
                 if _rand == 0:
                     if verbose:
                         print('No mutatible kwargs, mutate global vars.')
@@ -211,7 +275,7 @@ class Fuzzer:
                     change_args = True
             else:
                 # Mutate random vars
-                _rand = random.randint(0, 2)
+                _rand = self.random.randint(0, 2)
                 if _rand == 0:
                     change_args = True
                 elif _rand == 1:
@@ -226,7 +290,7 @@ class Fuzzer:
             elif self._args_mutatible(selected_args) and not self._args_mutatible(list(selected_kwargs.values())):
                 change_args = True
             elif self._args_mutatible(selected_args) and self._args_mutatible(list(selected_kwargs.values())):
-                _rand = random.randint(0, 1)
+                _rand = self.random.randint(0, 1)
                 if _rand == 0:
                     change_args = True
                 else:
@@ -238,7 +302,7 @@ class Fuzzer:
             elif self._args_mutatible(selected_args) and not self._args_mutatible(list(selected_kwargs.values())):
                 change_args = True
             else:
-                _rand = random.randint(0, 1)
+                _rand = self.random.randint(0, 1)
                 if _rand == 0:
                     change_args = True
                 else:
@@ -286,7 +350,7 @@ class Fuzzer:
                     candidate_vars.append(name)
 
                 if len(candidate_vars) != 0:
-                    random.shuffle(candidate_vars)
+                    self.random.shuffle(candidate_vars)
                     copy_global_vars[candidate_vars[0]] = self.mutate_object(
                         copy_global_vars[candidate_vars[0]], candidate_vars[0]
                     )
@@ -294,74 +358,158 @@ class Fuzzer:
         return copy_args, copy_kwargs, copy_global_vars
 
     def update_args(self, new_args, new_kwargs, new_global_vars, verbose=True):
-        local_vars, global_vars, exc, line = self.run(new_args, new_kwargs, new_global_vars, verbose)
-        if isinstance(exc, type(self.exception)) and self.excep_line == line:
+        found, exc_name, line, is_same, local_diffs, global_diffs, edges = self.observe(
+            new_args, new_kwargs, new_global_vars, verbose
+        )
+        if found:
             if verbose:
                 print('Exception raised, stop fuzzing.')
             return new_args, new_kwargs, new_global_vars, True
         elif line != -1 and self.excep_line != line:
             if verbose:
                 print(f'Exception raised at line {line}, but expected at line {self.excep_line}.')
-        elif not isinstance(exc, type(self.exception)):
+        else:
             if verbose:
-                print(f'Exception raised: {type(exc)}, but expected {type(self.exception)}.')
+                print(f'Exception raised: {exc_name}, but expected {type(self.exception).__qualname__}.')
 
-        if line != -1 and (len(local_vars) != 0 or len(global_vars) != 0):
-            is_same, local_diffs, global_diffs = self.is_vars_same(local_vars, global_vars, verbose)
+        interesting = self.update_coverage(edges)
+        if is_same is not None:
             if is_same:
                 if verbose:
                     print('All states same, but exception not raised.')
         else:
-            if verbose:
-                print('No exception thrown, add this args to corpus.')
+            if interesting:
+                if verbose:
+                    print('No exception thrown, but new coverage. Add this args to corpus.')
+                self.add_to_corpus(new_args, new_kwargs, new_global_vars, edges)
             new_args, new_kwargs, new_global_vars = self.mutate(verbose=verbose)
             return new_args, new_kwargs, new_global_vars, False
 
         # TODO: def-use chain
-        for name, value in local_diffs.items():
+        for name in local_diffs:
             if name not in self.candidate_vars:
                 self.candidate_vars.append(name)
                 if verbose:
                     print(f'Add candidate variable {name}')
-        for name, value in global_diffs.items():
+        for name in global_diffs:
             if name not in self.candidate_vars:
                 self.candidate_vars.append(name)
                 if verbose:
                     print(f'Add candidate variable {name}')
 
-        if exc is not None:
+        if interesting if self.coverage is not None else exc_name is not None:
             # TODO: loss function
-            globals = prune_default_global_var(self.fn, new_global_vars)
-            self.corpus.append(
-                (
-                    new_args,
-                    new_kwargs,
-                    globals,
-                )
-            )
+            self.add_to_corpus(new_args, new_kwargs, new_global_vars, edges)
         new_args, new_kwargs, new_global_vars = self.mutate(local_diffs, global_diffs, verbose=verbose)
         return new_args, new_kwargs, new_global_vars, False
 
+    def add_to_corpus(self, args, kwargs, global_vars, edges: FrozenSet[Edge] = frozenset()):
+        self.corpus.append((args, kwargs, prune_default_global_var(self.fn, global_vars)))
+        self.corpus_edges.append(edges)
+        self.corpus_distances.append(self.get_distance(edges))
+
+    def update_coverage(self, edges: FrozenSet[Edge]) -> bool:
+        """
+        Counts the edges covered by a trial.
+        :return: True if the trial covered a new edge or a line closer to excep_line than the previous trials
+        """
+        if self.coverage is None or len(edges) == 0:
+            return False
+
+        new_edge = any(edge not in self.edge_counts for edge in edges)
+        self.edge_counts.update(edges)
+        distance = self.get_distance(edges)
+        closer = distance is not None and (self.best_distance is None or distance < self.best_distance)
+        if closer:
+            self.best_distance = distance
+        return new_edge or closer
+
+    def get_distance(self, edges: FrozenSet[Edge]) -> Optional[int]:
+        """Distance between excep_line and the closest line covered by edges."""
+        if self.block_distance is not None:
+            return self.block_distance.get_min_distance(line for _, line in edges)
+        return min((abs(self.excep_line - line) for _, line in edges), default=None)
+
+    def get_energy(self, edges: FrozenSet[Edge], distance: Optional[int] = None) -> float:
+        """
+        Seeds that cover edges reached by few trials are selected more often.
+        In directed fuzzing, the energy is also halved for each basic block between the seed and excep_line.
+        """
+        energy = sum(1 / self.edge_counts[edge] for edge in edges)
+        if self.block_distance is not None:
+            if distance is None:
+                # Can't reach excep_line, less energy than any seed that can reach it
+                distance = len(self.block_distance.distances)
+            energy *= 2.0 ** -distance
+        return energy
+
+    def select_seed(self) -> int:
+        if self.coverage is None or len(self.edge_counts) == 0:
+            return self.random.randint(0, len(self.corpus) - 1)
+
+        energies = [
+            self.get_energy(edges, distance) if len(edges) != 0 else None
+            for edges, distance in zip(self.corpus_edges, self.corpus_distances)
+        ]
+        # Seeds without coverage (initial inputs) get the lowest energy
+        default_energy = min((e for e in energies if e is not None), default=1.0)
+        weights = [e if e is not None else default_energy for e in energies]
+        return self.random.choices(range(len(self.corpus)), weights)[0]
+
     def fuzz(self, verbose=True):
+        key = None
+        if self.corpus_store is not None:
+            key = self.corpus_store.get_key(self.fn, self.exception, self.excep_line)
+            new_args, new_kwargs, new_global_vars = self.warm_start(self.corpus_store.load(key), verbose)
+            if new_args is not None:
+                return new_args, new_kwargs, new_global_vars
+
+        if self.jobs > 1 and 'fork' in mp.get_all_start_methods():
+            new_args, new_kwargs, new_global_vars = self.fuzz_parallel(verbose)
+        else:
+            new_args, new_kwargs, new_global_vars, _ = self.fuzz_trials(self.MAX_TRIALS, verbose)
+
+        if key is not None and new_args is not None:
+            self.corpus_store.store(
+                key, (new_args, new_kwargs, prune_default_global_var(self.fn, new_global_vars))
+            )
+        return new_args, new_kwargs, new_global_vars
+
+    def warm_start(self, stored_inputs, verbose=True):
+        """
+        Runs the inputs stored by previous runs and adds them to the corpus.
+        :return: the first inputs that reproduce the exception, or None
+        """
+        for args, kwargs, global_vars in stored_inputs:
+            found, _, _, _, _, _, edges = self.observe(args, kwargs, global_vars, verbose)
+            if found:
+                print('Exception reproduced with the inputs of a previous run!')
+                return args, kwargs, global_vars
+            self.update_coverage(edges)
+            self.add_to_corpus(args, kwargs, global_vars, edges)
+
+        if verbose and len(stored_inputs) != 0:
+            print(f'{len(stored_inputs)} inputs of previous runs added to corpus.')
+        return None, None, None
+
+    def fuzz_trials(self, max_trials: int, verbose=True):
+        """
+        Mutates and runs the inputs up to max_trials times.
+        :return: inputs that reproduce the exception (or None) and the number of trials
+        """
         new_args = self.args
         new_kwargs = self.kwargs
         new_global_vars = self.global_vars
-        self.corpus.append(
-            (
-                new_args,
-                new_kwargs,
-                prune_default_global_var(self.fn, new_global_vars),
-            )
-        )
+        self.add_to_corpus(new_args, new_kwargs, new_global_vars)
 
         trial = 1
         if not verbose:
             print()
-        while trial <= self.MAX_TRIALS:
+        while trial <= max_trials:
             if verbose:
                 print(f'Trial: {trial}')
             else:
-                progress = int((trial + 1) / self.MAX_TRIALS * 10)
+                progress = int((trial + 1) / max_trials * 10)
                 print("\033[F\rSearching a basic example: [" + "#" * progress + " " * (10 - progress) + "]")
             new_args, new_kwargs, new_global_vars, finished = self.update_args(
                 new_args, new_kwargs, new_global_vars, verbose
@@ -369,10 +517,138 @@ class Fuzzer:
             if finished:
                 if not verbose:
                     print(f"Exception found at trial {trial}!")
-                return new_args, new_kwargs, new_global_vars
+                return new_args, new_kwargs, new_global_vars, trial
             trial += 1
 
-        return None, None, None
+        return None, None, None, max_trials
+
+    def _fuzz_worker(self, seed: int, max_trials: int, queue):
+        self.random.seed(seed)
+        sys.stdout = open(os.devnull, 'w')  # Only the parent reports progress
+        new_args, new_kwargs, new_global_vars, trial = self.fuzz_trials(max_trials, verbose=False)
+        if new_args is None:
+            queue.put((seed, None, None))
+            return
+
+        try:
+            data = pickle.dumps((new_args, new_kwargs, new_global_vars))
+        except Exception:
+            data = None  # The parent replays the trials with the same seed
+        queue.put((seed, trial, data))
+
+    def fuzz_parallel(self, verbose=True, timeout: Optional[float] = None):
+        """
+        Runs fuzz_trials in self.jobs forked workers with different seeds, splitting MAX_TRIALS between them.
+        The first worker that reproduces the exception wins and the others are terminated.
+        All workers are terminated after timeout seconds (PARALLEL_TIMEOUT by default), e.g. when a trial hangs.
+        """
+        ctx = mp.get_context('fork')
+        queue = ctx.Queue()
+        deadline = time.monotonic() + (timeout if timeout is not None else self.PARALLEL_TIMEOUT)
+        base_seed = self.random.getrandbits(32)
+        max_trials = -(-self.MAX_TRIALS // self.jobs)
+        workers = [
+            ctx.Process(target=self._fuzz_worker, args=(base_seed + i, max_trials, queue)) for i in range(self.jobs)
+        ]
+        if verbose:
+            print(f'Fuzzing with {self.jobs} workers, {max_trials} trials each')
+        for worker in workers:
+            worker.start()
+
+        result = None
+        finished = 0
+        try:
+            while finished < len(workers):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    print(f'Fuzzing workers timed out, {len(workers) - finished} of them are terminated')
+                    break
+                try:
+                    seed, trial, data = queue.get(timeout=min(1, remaining))
+                except queue_module.Empty:
+                    if not any(worker.is_alive() for worker in workers) and queue.empty():
+                        break  # Workers died without reporting
+                    continue
+                finished += 1
+                if trial is not None:
+                    result = (seed, trial, data)
+                    break
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+            for worker in workers:
+                worker.join(timeout=1)
+                if worker.is_alive():
+                    worker.kill()  # Ignored SIGTERM
+                    worker.join()
+
+        if result is None:
+            return None, None, None
+
+        seed, trial, data = result
+        print(f'Exception found at trial {trial} of the worker with seed {seed}!')
+        if data is not None:
+            return pickle.loads(data)
+
+        # Inputs can't be pickled, reproduce them in this process
+        self.random.seed(seed)
+        new_args, new_kwargs, new_global_vars, _ = self.fuzz_trials(trial, verbose)
+        return new_args, new_kwargs, new_global_vars
+
+    def observe(self, new_args, new_kwargs, new_global_vars, verbose=True):
+        """
+        Runs the inputs and compares the states at the exception with the buggy states.
+        With self.fork, the inputs run in a forked child and only this summary is sent back. A child that fails
+        is a failed trial, the inputs only run in this process if the child can't be forked.
+        :return: whether the exception is reproduced at excep_line, type name of the raised exception (or None),
+                line of the exception (-1 if not raised), whether all states are same (None if not compared),
+                names of different local variables, names of different global variables, edges covered by the run
+        """
+        if self.fork:
+            try:
+                summary = run_forked(
+                    lambda: self._observe(new_args, new_kwargs, new_global_vars, verbose, copy_inputs=False)
+                )
+            except OSError:
+                if verbose:
+                    print('Fork failed, run with copied inputs.')
+            else:
+                if summary is not FORK_FAILED:
+                    return summary
+                if verbose:
+                    print('Forked execution failed.')
+                return False, None, -1, None, [], [], frozenset()
+
+        return self._observe(new_args, new_kwargs, new_global_vars, verbose)
+
+    def _observe(self, new_args, new_kwargs, new_global_vars, verbose=True, copy_inputs=True):
+        edges: FrozenSet[Edge] = frozenset()
+        if self.coverage is not None:
+            with self.coverage:
+                local_vars, global_vars, exc, line = self.run(
+                    new_args, new_kwargs, new_global_vars, verbose, copy_inputs
+                )
+            edges = self.coverage.get_edges()
+        else:
+            local_vars, global_vars, exc, line = self.run(new_args, new_kwargs, new_global_vars, verbose, copy_inputs)
+
+        found = isinstance(exc, type(self.exception)) and self.excep_line == line
+        exc_name = type(exc).__qualname__ if exc is not None else None
+        if found or line == -1 or (len(local_vars) == 0 and len(global_vars) == 0):
+            return found, exc_name, line, None, [], [], edges
+
+        is_same, local_diffs, global_diffs = self.is_vars_same(local_vars, global_vars, verbose)
+        return found, exc_name, line, is_same, list(local_diffs), list(global_diffs), edges
+
+    def get_snapshot(self, name: str, is_global=False) -> PickledObject:
+        snapshots = self.global_snapshots if is_global else self.local_snapshots
+        if name not in snapshots:
+            # Baseline values that are filtered as default
+            buggy_vars = self.global_vars if is_global else self.local_vars
+            memo = self.global_memo if is_global else self.local_memo
+            snapshots[name] = pickle_object(self.fn, name, buggy_vars[name], is_global=is_global, pickled_ids=memo)
+        return snapshots[name]
 
     def is_vars_same(self, local_vars, global_vars, verbose=False):
         is_same = True
@@ -381,6 +657,7 @@ class Fuzzer:
 
         if verbose:
             print('Compare local variables...')
+        pickled_objs = SnapshotMemo()
         for name, obj in local_vars.items():
             if is_default_local(self.fn, name, obj):
                 continue
@@ -392,10 +669,8 @@ class Fuzzer:
                 local_diffs[name] = (obj, None)
                 continue
 
-            pickled_objs = dict()
             _obj = pickle_object(self.fn, name, obj, pickled_ids=pickled_objs)
-            pickled_objs = dict()
-            base_obj = pickle_object(self.fn, name, self.local_vars[name], pickled_ids=pickled_objs)
+            base_obj = self.get_snapshot(name)
             if _obj is not None:
                 _is_same = compare_object(_obj, base_obj)
                 if not _is_same:
@@ -411,6 +686,7 @@ class Fuzzer:
         if not self.skip_global:
             if verbose:
                 print('Compare global variables...')
+            pickled_objs = SnapshotMemo()
             for name, obj in global_vars.items():
                 if is_default_global(self.fn, name, obj):
                     continue
@@ -422,16 +698,8 @@ class Fuzzer:
                     global_diffs[name] = (obj, None)
                     continue
 
-                pickled_objs = dict()
                 _obj = pickle_object(self.fn, name, obj, is_global=True, pickled_ids=pickled_objs)
-                pickled_objs = dict()
-                base_obj = pickle_object(
-                    self.fn,
-                    name,
-                    self.global_vars[name],
-                    is_global=True,
-                    pickled_ids=pickled_objs,
-                )
+                base_obj = self.get_snapshot(name, is_global=True)
                 if _obj is not None:
                     _is_same = compare_object(_obj, base_obj)
                     if not _is_same:
@@ -456,6 +724,7 @@ class Fuzzer:
         new_kwargs: Dict[str, object],
         new_globals: Dict[str, object],
         verbose=True,
+        copy_inputs=True,
     ) -> Tuple[
         Dict[str, object], Dict[str, object], Optional[Exception], int
     ]:  # Tuple[List[z3.BoolRef],Dict[str,object],Dict[str,object]]:
@@ -469,10 +738,14 @@ class Fuzzer:
         Now, we assume that the heap of the arguments are changed, but arguments itself are not changed.
         e.g. Possible cases: arg.field changed
                 Impossible cases: arg = 0 to arg = 1
+        If copy_inputs is False, the inputs are used as is, e.g. in a forked child.
         """
         # Prune default variables
         next_globals = prune_default_global_var(self.fn, new_globals)
-        args, kwargs, globals = deepcopy([new_args, new_kwargs, next_globals])
+        if copy_inputs:
+            args, kwargs, globals = deepcopy([new_args, new_kwargs, next_globals])
+        else:
+            args, kwargs, globals = new_args, new_kwargs, next_globals
         for name, obj in globals.items():
             self.fn.__globals__[name] = obj
 
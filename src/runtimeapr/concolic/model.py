@@ -16,6 +16,8 @@ try:
 except:
     from graphviz import Digraph
 import re
+from array import array
+import bisect
 from collections import Counter, deque
 import os
 
@@ -303,6 +305,8 @@ class CFG(object):
         self.lineno: int = 0
         self.end_lineno: int = 0
         self.qualname = ""
+        # Array-backed form of the blocks, built on first use.
+        self._compact: Optional["CompactCFG"] = None
 
     def __str__(self) -> str:
         return "CFG for {}".format(self.name)
@@ -703,6 +707,18 @@ class CFG(object):
                 to_visit.append(exit_.target)
             yield block
 
+    def get_compact(self) -> "CompactCFG":
+        """
+        Get the array-backed form of the blocks of the CFG, built once.
+        The CFG must not be changed after this call.
+
+        Returns:
+            The CompactCFG of the own blocks of the CFG.
+        """
+        if self._compact is None:
+            self._compact = CompactCFG(self)
+        return self._compact
+
     def node_ClassDef(
         self, block: Block, typeobj: type
     ) -> Tuple[str, str, str]:
@@ -820,3 +836,169 @@ class CFG(object):
         # TODO find all possible paths from entry to final and return set
         # TODO find path from any line to any line
         return collections.deque()
+
+
+class CompactCFG(object):
+    """
+    Array-backed form of the own blocks of a CFG (sub-CFGs excluded).
+
+    Blocks are numbered from 0 (the entry block) in breadth-first order, and
+    graph algorithms work on these integers instead of Block and Link
+    objects. Successors and predecessors are stored in CSR form: the
+    successors of block i are succ[succ_start[i]:succ_start[i + 1]]. Line
+    spans of the blocks are computed once, and lines are mapped to blocks by
+    a binary search over the spans sorted by their first line.
+
+    Reachability is computed on first use with an iterative dataflow pass,
+    and stored as one bitset (int) per block where bit j stands for block j.
+    """
+
+    __slots__ = (
+        "blocks",
+        "index",
+        "starts",
+        "ends",
+        "succ_start",
+        "succ",
+        "pred_start",
+        "pred",
+        "span_starts",
+        "span_blocks",
+        "_reachable",
+        "_line_masks",
+    )
+
+    def __init__(self, cfg: CFG) -> None:
+        # Blocks by their number, and numbers by block id.
+        self.blocks: List[Block] = list(cfg.own_blocks())
+        self.index: Dict[int, int] = {
+            block.id: i for i, block in enumerate(self.blocks)
+        }
+        # First and last lines of the blocks, -1 for empty blocks.
+        self.starts = array("i", (block.at() for block in self.blocks))
+        self.ends = array("i", (block.end() for block in self.blocks))
+
+        self.succ_start = array("i", [0])
+        self.succ = array("i")
+        preds: List[List[int]] = [[] for _ in self.blocks]
+        for i, block in enumerate(self.blocks):
+            for link in block.exits:
+                j = self.index[link.target.id]
+                self.succ.append(j)
+                preds[j].append(i)
+            self.succ_start.append(len(self.succ))
+        self.pred_start = array("i", [0])
+        self.pred = array("i")
+        for sources in preds:
+            self.pred.extend(sources)
+            self.pred_start.append(len(self.pred))
+
+        # Non-empty blocks sorted by their first line.
+        spans = sorted(
+            (start, i) for i, start in enumerate(self.starts) if start >= 0
+        )
+        self.span_starts = array("i", (start for start, _ in spans))
+        self.span_blocks = array("i", (i for _, i in spans))
+
+        self._reachable: Optional[List[int]] = None
+        # Line -> bitset of the blocks whose span contains the line.
+        self._line_masks: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.blocks)
+
+    def successors(self, i: int) -> array:
+        return self.succ[self.succ_start[i] : self.succ_start[i + 1]]
+
+    def predecessors(self, i: int) -> array:
+        return self.pred[self.pred_start[i] : self.pred_start[i + 1]]
+
+    def find_block(self, line: int) -> Optional[int]:
+        """
+        Get the block whose line span contains a line.
+
+        Args:
+            line: The line in the program.
+
+        Returns:
+            The number of the block starting last among the blocks that
+            contain the line, or None if no block contains it.
+        """
+        k = bisect.bisect_right(self.span_starts, line) - 1
+        while k >= 0:
+            i = self.span_blocks[k]
+            if self.ends[i] >= line:
+                return i
+            k -= 1
+        return None
+
+    def postorder(self) -> List[int]:
+        """
+        Get the blocks reachable from the entry in depth-first postorder,
+        successors before their predecessors except for back edges.
+        """
+        order: List[int] = []
+        visited = bytearray(len(self.blocks))
+        if len(self.blocks) == 0:
+            return order
+        visited[0] = 1
+        # (block, index of its next successor in succ)
+        stack = [(0, self.succ_start[0])]
+        while stack:
+            i, k = stack[-1]
+            if k < self.succ_start[i + 1]:
+                stack[-1] = (i, k + 1)
+                target = self.succ[k]
+                if not visited[target]:
+                    visited[target] = 1
+                    stack.append((target, self.succ_start[target]))
+            else:
+                stack.pop()
+                order.append(i)
+        return order
+
+    def get_reachable(self) -> List[int]:
+        """
+        Get the blocks reachable from each block, the block included.
+
+        Returns:
+            One bitset per block.
+        """
+        if self._reachable is None:
+            reachable = [1 << i for i in range(len(self.blocks))]
+            order = self.postorder()
+            changed = True
+            while changed:
+                changed = False
+                for i in order:
+                    bits = reachable[i]
+                    for k in range(self.succ_start[i], self.succ_start[i + 1]):
+                        bits |= reachable[self.succ[k]]
+                    if bits != reachable[i]:
+                        reachable[i] = bits
+                        changed = True
+            self._reachable = reachable
+        return self._reachable
+
+    def get_line_mask(self, line: int) -> int:
+        """
+        Get the blocks whose line span contains a line.
+
+        Returns:
+            The bitset of the blocks.
+        """
+        mask = self._line_masks.get(line)
+        if mask is None:
+            mask = 0
+            for i in range(len(self.blocks)):
+                if self.starts[i] <= line <= self.ends[i]:
+                    mask |= 1 << i
+            self._line_masks[line] = mask
+        return mask
+
+    def can_reach_line(self, i: int, line: int) -> bool:
+        """
+        Check if a block whose line span contains a line is reachable from
+        block i, block i included.
+        """
+        return self.get_reachable()[i] & self.get_line_mask(line) != 0
@@ -8,10 +8,14 @@ import struct
 from runtimeapr.concolic import FunctionGenerator
 from runtimeapr.concolic.fuzzing import Fuzzer
 
+from .corpus import CorpusStore
 from .defusegraph import DefUseGraph
+from .forkexec import FORK_FAILED, can_fork, get_picklable, run_forked
+from ..configure import Configure
 from ..loop.repairutils import (
     PickledObject,
     SetObject,
+    SnapshotMemo,
     compare_object,
     is_default_global,
     is_default_local,
@@ -20,7 +24,7 @@ from ..loop.repairutils import (
     prune_default_local_var,
 )
 
-from typing import Dict, List, Set, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 from types import FunctionType, ModuleType
 import inspect
 from copy import deepcopy, copy
@@ -41,17 +45,39 @@ class StateReproducer:
         global_vars: Dict[str, object],
         def_use_chain: Dict[str, List[str]],
         exception: Exception,
+        *,
+        fork: Optional[bool] = None,
+        corpus_store: Optional[CorpusStore] = None,
     ):
         self.fn = fn
         self.args_names = args_names
         self.buggy_local_vars = prune_default_local_var(self.fn, buggy_local_vars)
         self.buggy_global_vars = prune_default_global_var(self.fn, buggy_global_vars)
+        # Snapshots of the buggy state, taken once and compared with the state of every trial
+        memo = SnapshotMemo()
+        self.buggy_local_snapshots: Dict[str, PickledObject] = {
+            name: pickle_object(self.fn, name, obj, pickled_ids=memo) for name, obj in self.buggy_local_vars.items()
+        }
+        memo = SnapshotMemo()
+        self.buggy_global_snapshots: Dict[str, PickledObject] = {
+            name: pickle_object(self.fn, name, obj, is_global=True, pickled_ids=memo)
+            for name, obj in self.buggy_global_vars.items()
+        }
         self.args = args
         self.arg_names = list(inspect.signature(self.fn).parameters.keys())
         self.kwargs = kwargs
         self.global_vars = prune_default_global_var(self.fn, global_vars)
         self.def_use_chains = def_use_chain
         self.exception = exception
+        # Run each trial in a forked child instead of a deepcopy of the inputs
+        self.fork = (fork if fork is not None else Configure.fork_execution) and can_fork()
+        # Inputs that reproduced the buggy states in previous runs
+        if corpus_store is None and Configure.corpus_dir is not None:
+            corpus_store = CorpusStore(Configure.corpus_dir)
+        self.corpus_store = corpus_store
+        self.corpus_key = (
+            corpus_store.get_key(self.fn, self.exception, kind='state') if corpus_store is not None else None
+        )
         self.solution = None
         self.examples: List[Tuple[Dict[str, object], Dict[str, object], Dict[str, object]]] = []
         """
@@ -78,10 +104,61 @@ class StateReproducer:
         new_kwargs: Dict[str, object],
         new_globals: Dict[str, object],
         verbose=True,
+        compare_verbose=None,
     ):
+        """
+        Runs the function with the inputs and compares the states at the exception with the buggy states.
+        With self.fork, the inputs run in a forked child that compares the states and sends back only the
+        names of the different variables and the variables that can be pickled. A child that fails is a failed trial.
+        :param compare_verbose: verbose of is_vars_same(), verbose if None
+        :return: local and global variables at the exception without the default ones, and their differences
+                 from the buggy states as returned by is_vars_same(); all None if the exception is not raised
+        """
+        if compare_verbose is None:
+            compare_verbose = verbose
+        if self.fork:
+            try:
+                summary = run_forked(
+                    lambda: self._summarize(new_args, new_kwargs, new_globals, verbose, compare_verbose)
+                )
+            except OSError:
+                if verbose:
+                    print('Fork failed, run with copied inputs.')
+            else:
+                if summary is FORK_FAILED:
+                    if verbose:
+                        print('Forked execution failed.')
+                    return None, None, None, None
+                if summary is None:
+                    return None, None, None, None
+                local_vars, global_vars, local_names, global_names = summary
+                local_diffs = {name: (local_vars.get(name), self.buggy_local_vars.get(name)) for name in local_names}
+                global_diffs = {
+                    name: (global_vars.get(name), self.buggy_global_vars.get(name)) for name in global_names
+                }
+                return local_vars, global_vars, local_diffs, global_diffs
+
+        local_vars, global_vars = self._run(new_args, new_kwargs, new_globals, verbose)
+        if local_vars is None:
+            return None, None, None, None
+        local_diffs, global_diffs = self.is_vars_same(local_vars, global_vars, compare_verbose)
+        return local_vars, global_vars, local_diffs, global_diffs
+
+    def _summarize(self, new_args, new_kwargs, new_globals, verbose, compare_verbose):
+        """Summary of a trial sent back by a forked child, see run()."""
+        local_vars, global_vars = self._run(new_args, new_kwargs, new_globals, verbose, copy_inputs=False)
+        if local_vars is None:
+            return None
+        local_diffs, global_diffs = self.is_vars_same(local_vars, global_vars, compare_verbose)
+        return get_picklable(local_vars), get_picklable(global_vars), list(local_diffs), list(global_diffs)
+
+    def _run(self, new_args, new_kwargs, new_globals, verbose=True, copy_inputs=True):
         # Prune default variables
         next_globals = prune_default_global_var(self.fn, new_globals)
-        args, kwargs, globals = deepcopy([new_args, new_kwargs, next_globals])
+        if copy_inputs:
+            args, kwargs, globals = deepcopy([new_args, new_kwargs, next_globals])
+        else:
+            args, kwargs, globals = new_args, new_kwargs, next_globals
         for name, obj in globals.items():
             self.fn.__globals__[name] = obj
 
@@ -105,7 +182,11 @@ class StateReproducer:
                 cur_index += 1
                 inner_info = innerframes[cur_index]
 
-            return inner_info.frame.f_locals, inner_info.frame.f_globals
+            # Pruned here for both backends, so only the states are sent back from a forked child
+            return (
+                prune_default_local_var(self.fn, inner_info.frame.f_locals),
+                prune_default_global_var(self.fn, inner_info.frame.f_globals),
+            )
 
         return None, None
 
@@ -116,6 +197,7 @@ class StateReproducer:
 
         if verbose:
             print('Compare local variables...')
+        memo = SnapshotMemo()
         for name, obj in local_vars.items():
             if is_default_local(self.fn, name, obj):
                 continue
@@ -127,8 +209,8 @@ class StateReproducer:
                 local_diffs[name] = (obj, None)
                 continue
 
-            _obj = pickle_object(self.fn, name, obj)
-            base_obj = pickle_object(self.fn, name, self.buggy_local_vars[name])
+            _obj = pickle_object(self.fn, name, obj, pickled_ids=memo)
+            base_obj = self.buggy_local_snapshots[name]
             if _obj is not None:
                 _is_same = compare_object(_obj, base_obj)
                 if not _is_same:
@@ -142,6 +224,7 @@ class StateReproducer:
 
         if verbose:
             print('Compare global variables...')
+        memo = SnapshotMemo()
         for name, obj in global_vars.items():
             if is_default_global(self.fn, name, obj):
                 continue
@@ -153,8 +236,8 @@ class StateReproducer:
                 global_diffs[name] = (obj, None)
                 continue
 
-            _obj = pickle_object(self.fn, name, obj, is_global=True)
-            base_obj = pickle_object(self.fn, name, self.buggy_global_vars[name], is_global=True)
+            _obj = pickle_object(self.fn, name, obj, is_global=True, pickled_ids=memo)
+            base_obj = self.buggy_global_snapshots[name]
             if _obj is not None:
                 _is_same = compare_object(_obj, base_obj)
                 if not _is_same:
@@ -625,13 +708,11 @@ class StateReproducer:
                 new_kwargs[name] = obj
             elif name in new_globals:
                 new_globals[name] = obj
-        reproduced_local_vars, reproduced_global_vars = self.run(new_args, new_kwargs, new_globals)
+        reproduced_local_vars, reproduced_global_vars, local_diffs, global_diffs = self.run(
+            new_args, new_kwargs, new_globals
+        )
         if reproduced_local_vars is None:
             pass
-        local_diffs, global_diffs = self.is_vars_same(
-            prune_default_local_var(self.fn, reproduced_local_vars),
-            prune_default_global_var(self.fn, reproduced_global_vars),
-        )
         if len(local_diffs) == 0 and len(global_diffs) == 0:
             print(f'States reproduced by model')
             return predicted
@@ -716,7 +797,9 @@ class StateReproducer:
 
                 prev_args, prev_kwargs, prev_globals = deepcopy([new_args, new_kwargs, new_globals])
                 new_args, new_kwargs, new_globals = deepcopy([new_args, new_kwargs, new_globals])
-                reproduced_local_vars, reproduced_global_vars = self.run(prev_args, prev_kwargs, prev_globals, verbose)
+                reproduced_local_vars, reproduced_global_vars, local_diffs, global_diffs = self.run(
+                    prev_args, prev_kwargs, prev_globals, verbose
+                )
                 if reproduced_local_vars is None:
                     if verbose:
                         print(f'Exception not raised, skip!')
@@ -763,16 +846,10 @@ class StateReproducer:
 
                     continue
 
-                cleaned_reproduced_local_vars = prune_default_local_var(self.fn, reproduced_local_vars)
-                cleaned_reproduced_global_vars = prune_default_global_var(self.fn, reproduced_global_vars)
-                local_diffs, global_diffs = self.is_vars_same(
-                    cleaned_reproduced_local_vars,
-                    cleaned_reproduced_global_vars,
-                    verbose,
-                )
                 if len(local_diffs) == 0 and len(global_diffs) == 0:
                     print(f'States reproduced in trial {trial}')
-                    self.solution = (cleaned_reproduced_local_vars, cleaned_reproduced_global_vars)
+                    self.solution = (reproduced_local_vars, reproduced_global_vars)
+                    self.save_inputs(prev_args, prev_kwargs, prev_globals)
                     return examples
 
                 cur_local_values = dict()
@@ -784,8 +861,8 @@ class StateReproducer:
                 examples.append(
                     (
                         prune_default_global_var(self.fn, prev_globals),
-                        prune_default_local_var(self.fn, reproduced_local_vars),
-                        prune_default_global_var(self.fn, reproduced_global_vars),
+                        reproduced_local_vars,
+                        reproduced_global_vars,
                     )
                 )
                 if not ignore_first:
@@ -883,8 +960,33 @@ class StateReproducer:
                 reproduced_global_vars,
             )
 
+    def save_inputs(self, args: List[object], kwargs: Dict[str, object], globals: Dict[str, object]):
+        if self.corpus_store is not None:
+            self.corpus_store.store(self.corpus_key, (args, kwargs, prune_default_global_var(self.fn, globals)))
+
+    def warm_start(self) -> Optional[Dict[str, object]]:
+        """
+        Runs the inputs that reproduced the buggy states in previous runs.
+        :return: the first inputs that still reproduce the states, same as reproduce(), or None
+        """
+        if self.corpus_store is None:
+            return None
+
+        for args, kwargs, globals in self.corpus_store.load(self.corpus_key):
+            reproduced_local_vars, _, local_diffs, global_diffs = self.run(args, kwargs, globals, verbose=False)
+            if reproduced_local_vars is None:
+                continue
+            if len(local_diffs) == 0 and len(global_diffs) == 0:
+                print('States reproduced with the inputs of a previous run')
+                dict_args = dict(zip(self.arg_names, args))
+                return {**globals, **dict_args, **kwargs}
+        return None
+
     def reproduce(self) -> Dict[str, object]:
         print()
+        func_entry = self.warm_start()
+        if func_entry is not None:
+            return func_entry
         examples = self.generate_args()
         if self.solution is not None:
             self.solution[1].update(self.solution[0])
@@ -914,16 +1016,14 @@ class StateReproducer:
                     if not isinstance(value, str):
                         new_globals[varname] = value
 
-            reproduced_local_vars, reproduced_global_vars = self.run(new_args, new_kwargs, new_globals, verbose=True)
+            reproduced_local_vars, reproduced_global_vars, local_diffs, global_diffs = self.run(
+                new_args, new_kwargs, new_globals, verbose=True, compare_verbose=False
+            )
             if reproduced_local_vars is None:
                 self.improve(str_states, fun_gens, reproduced_int)
-            local_diffs, global_diffs = self.is_vars_same(
-                prune_default_local_var(self.fn, reproduced_local_vars),
-                prune_default_global_var(self.fn, reproduced_global_vars),
-                verbose=False,
-            )
             if len(local_diffs) == 0 and len(global_diffs) == 0:
                 print(f'States reproduced after {trial} trial(s)')
+                self.save_inputs(new_args, new_kwargs, new_globals)
                 dict_args = dict(zip(self.arg_names, new_args))
                 return {**new_globals, **dict_args, **new_kwargs}
             print(f"Different output local: {local_diffs}, global: {global_diffs}")
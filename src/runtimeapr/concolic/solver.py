@@ -0,0 +1,328 @@
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import queue as queue_module
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import z3
+
+from ..configure import Configure
+from .ConcolicTracer import get_all_vars
+
+PathKey = Tuple[int, ...]
+"""
+ids of the conditions of a path, z3 expressions are hash-consed so equal conditions have equal ids.
+z3 reuses the id of a freed expression, so a key is only valid while its conditions are alive.
+"""
+
+
+def get_path_key(path: List[z3.BoolRef]) -> PathKey:
+    return tuple(cond.get_id() for cond in path)
+
+
+def get_python_value(value: z3.ExprRef) -> Any:
+    """Converts a value of a z3 model to int, float, bool or str, or returns it as is for other sorts."""
+    if z3.is_int_value(value) or z3.is_bv_value(value):
+        return value.as_long()
+    elif z3.is_rational_value(value):
+        return value.numerator_as_long() / value.denominator_as_long()
+    elif z3.is_algebraic_value(value):
+        return float(value.approx(20).as_fraction())
+    elif z3.is_true(value) or z3.is_false(value):
+        return z3.is_true(value)
+    elif z3.is_string_value(value):
+        return value.as_string()
+    return value
+
+
+def get_model_values(model: z3.ModelRef) -> Dict[str, Any]:
+    """Values of the variables of model, converted by get_python_value()."""
+    return {decl.name(): get_python_value(model[decl]) for decl in model.decls() if decl.arity() == 0}
+
+
+def get_vars(path: List[z3.BoolRef]) -> Dict[str, z3.ExprRef]:
+    """Variables of the conditions of path by their names."""
+    return {var.decl().name(): var for cond in path for var in get_all_vars(cond)}
+
+
+def get_independent_groups(path: List[z3.BoolRef]) -> List[List[z3.BoolRef]]:
+    """
+    Partitions path into groups of conditions that share no variables, ordered by their first condition.
+    The groups are independent: path is sat if all of them are sat, and its model is the union of their models.
+    """
+    parents = list(range(len(path)))  # Union-find of the indices of the conditions
+
+    def find(i: int) -> int:
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    var_conds: Dict[int, int] = dict()  # id of a variable -> index of the first condition using it
+    for i, cond in enumerate(path):
+        for var in get_all_vars(cond):
+            j = var_conds.setdefault(var.get_id(), i)
+            parents[find(i)] = find(j)
+
+    groups: Dict[int, List[z3.BoolRef]] = dict()
+    for i, cond in enumerate(path):
+        groups.setdefault(find(i), []).append(cond)
+    return list(groups.values())
+
+
+PORTFOLIO = [
+    dict(),
+    dict(params={'smt.string_solver': 'z3str3'}),
+    dict(params={'smt.random_seed': 1, 'sat.random_seed': 1}),
+    dict(params={'smt.string_solver': 'seq', 'smt.random_seed': 2}),
+    dict(tactic='qfnra-nlsat'),
+    dict(params={'smt.random_seed': 3, 'smt.relevancy': 0}),
+]
+"""Solver settings raced by solve_portfolio(): global z3 parameters and an optional tactic"""
+
+PORTFOLIO_START = 500
+"""Milliseconds a query is solved in process before it is raced in the portfolio, so easy queries are not raced"""
+
+
+def _solve_config(smt2: str, config: dict, timeout: int) -> Tuple[str, Optional[Dict[str, Tuple[Any, str]]]]:
+    for name, value in config.get('params', dict()).items():
+        z3.set_param(name, value)
+    solver = z3.Tactic(config['tactic']).solver() if 'tactic' in config else z3.Solver()
+    solver.set('timeout', timeout)
+    solver.from_string(smt2)
+    result = solver.check()
+    if result != z3.sat:
+        return str(result), None
+
+    model = solver.model()
+    values = dict()
+    for decl in model.decls():
+        if decl.arity() == 0:
+            value = get_python_value(model[decl])
+            if not isinstance(value, (int, float, bool, str)):
+                value = str(value)  # z3 values can't be sent to the parent
+            values[decl.name()] = (value, decl.range().name())
+    return 'sat', values
+
+
+def _portfolio_worker(index: int, smt2: str, config: dict, timeout: int, queue):
+    try:
+        result, values = _solve_config(smt2, config, timeout)
+    except Exception:
+        result, values = 'unknown', None  # e.g. the tactic doesn't support the logic
+    queue.put((index, result, values))
+
+
+def solve_portfolio(path: List[z3.BoolRef], timeout: int, jobs: int) -> Tuple[str, Optional[Dict[str, Tuple[Any, str]]]]:
+    """
+    Solves path in jobs forked processes with different settings of PORTFOLIO, and returns the first sat or unsat.
+    Racing solvers on a shared CPU only slows them down, so at most one process per CPU is used,
+    and path is solved in this process with the default settings if fewer than two can be used.
+    :return: 'sat', 'unsat' or 'unknown', and the values of the model with the names of their sorts if sat
+    """
+    solver = z3.Solver()
+    solver.add(*path)
+    smt2 = solver.to_smt2()
+
+    jobs = min(jobs, len(PORTFOLIO), os.cpu_count() or 1)
+    if jobs < 2 or 'fork' not in mp.get_all_start_methods():
+        return _solve_config(smt2, PORTFOLIO[0], timeout)
+    ctx = mp.get_context('fork')
+    queue = ctx.Queue()
+    workers = [
+        ctx.Process(target=_portfolio_worker, args=(i, smt2, config, timeout, queue))
+        for i, config in enumerate(PORTFOLIO[:jobs])
+    ]
+    for worker in workers:
+        worker.start()
+
+    result, values = 'unknown', None
+    finished = 0
+    try:
+        while finished < len(workers):
+            try:
+                _, cur_result, cur_values = queue.get(timeout=1)
+            except queue_module.Empty:
+                if not any(worker.is_alive() for worker in workers) and queue.empty():
+                    break  # Workers died without answers
+                continue
+            finished += 1
+            if cur_result in ('sat', 'unsat'):
+                result, values = cur_result, cur_values
+                break
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        for worker in workers:
+            worker.join()
+
+    return result, values
+
+
+class SolverSession:
+    """
+    Incremental z3 solver for paths that share prefixes, e.g. the paths from ConditionTree.get_path().
+
+    The solver keeps one scope per condition of the last checked path. check() pops the scopes of the conditions
+    that differ from the last path and pushes the new ones, so the shared prefix is not asserted again and
+    the lemmas learned on it are kept. Results of the checked paths are cached, and a path that extends
+    an unsat path is unsat without solving. The session keeps the conditions of the cached paths alive,
+    so their ids are not reused by other conditions.
+    """
+
+    def __init__(self, timeout: Optional[int] = None):
+        self.timeout = timeout  # Milliseconds, no timeout if None
+        self.solver = z3.Solver()
+        if timeout is not None:
+            self.solver.set('timeout', timeout)
+        self.stack: List[int] = []  # ids of the conditions asserted in each scope
+        self.conditions: Dict[int, z3.BoolRef] = dict()  # Conditions whose ids are in stack or keys
+        self.results: Dict[PathKey, z3.CheckSatResult] = dict()
+        self.models: Dict[PathKey, z3.ModelRef] = dict()  # Models of sat paths
+        self.last_key: Optional[PathKey] = None
+
+    def is_unsat_prefix(self, path: List[z3.BoolRef]) -> bool:
+        """Returns True if a prefix of path (path itself included) is known to be unsat."""
+        key = get_path_key(path)
+        return any(self.results.get(key[:i]) == z3.unsat for i in range(1, len(key) + 1))
+
+    def is_unsat(self, key: PathKey) -> bool:
+        """Returns True if the path of key is known to be unsat, its prefixes are not checked."""
+        return self.results.get(key) == z3.unsat
+
+    def get_key(self, path: List[z3.BoolRef]) -> PathKey:
+        """Key of path, whose conditions are kept alive as long as the session."""
+        for cond in path:
+            self.conditions.setdefault(cond.get_id(), cond)
+        return get_path_key(path)
+
+    def add_unsat(self, path: List[z3.BoolRef]) -> None:
+        """Records path as unsat, e.g. if one of its independent groups is unsat."""
+        self.results[self.get_key(path)] = z3.unsat
+
+    def check(self, path: List[z3.BoolRef]) -> z3.CheckSatResult:
+        key = self.get_key(path)
+        self.last_key = key
+        for i in range(1, len(key) + 1):
+            if self.results.get(key[:i]) == z3.unsat:
+                return z3.unsat
+        if key in self.models:
+            return z3.sat
+
+        # Keep the scopes of the common prefix
+        common = 0
+        for old_id, new_id in zip(self.stack, key):
+            if old_id != new_id:
+                break
+            common += 1
+        if len(self.stack) > common:
+            self.solver.pop(len(self.stack) - common)
+            del self.stack[common:]
+        for cond, cond_id in zip(path[common:], key[common:]):
+            self.solver.push()
+            self.solver.add(cond)
+            self.stack.append(cond_id)
+
+        result = self.solver.check()
+        if result != z3.unknown:
+            self.results[key] = result  # unknown may be a timeout, try again later
+        if result == z3.sat:
+            self.models[key] = self.solver.model()
+        return result
+
+    def model(self) -> z3.ModelRef:
+        """Model of the last path checked as sat."""
+        if self.last_key in self.models:
+            return self.models[self.last_key]
+        return self.solver.model()
+
+
+class SolverCache:
+    """
+    Results of solved path constraints, shared by all queries of a repair session.
+
+    Queries are keyed by a hash of their simplified conjunction with the conjuncts sorted,
+    so a repeated query, or a query with the same constraints in another order, is answered without solving.
+    Each kind of query (namespace) stores its own solution, e.g. a model converted to Python values.
+    If a directory is given, results are also stored there as JSON for later runs, if their solutions are
+    plain values that JSON gives back unchanged (e.g. dicts of ints and strings, not tuples).
+    Entries are never unpickled, so a directory writable by others can't run code in this process.
+    """
+
+    def __init__(self, directory: Optional[Path] = None):
+        self.directory = Path(directory).resolve() if directory is not None else None
+        self.results: Dict[str, Tuple[str, Any]] = dict()  # key -> (result, solution)
+
+    @staticmethod
+    def get_key(path: List[z3.BoolRef], namespace: str = '') -> str:
+        simplified = z3.simplify(z3.And(*path)) if len(path) != 0 else z3.BoolVal(True)
+        conjuncts = simplified.children() if z3.is_and(simplified) else [simplified]
+        conjuncts = sorted(conjuncts, key=lambda c: c.sexpr())
+
+        # SMT-LIB of the conjuncts with the declarations of their variables. Not Solver.to_smt2(),
+        # which binds subterms with let depending on the other references z3 holds to them.
+        key = hashlib.sha256()
+        key.update(namespace.encode())
+        for name, var in sorted(get_vars(conjuncts).items()):
+            key.update(f'{name} {var.sort().sexpr()}\n'.encode())
+        for conjunct in conjuncts:
+            key.update(f'{conjunct.sexpr()}\n'.encode())
+        return key.hexdigest()
+
+    def get_path(self, key: str) -> Path:
+        return self.directory / key[:2] / f'{key}.json'
+
+    def get(self, key: str) -> Optional[Tuple[str, Any]]:
+        """Returns (result, solution) of the query of key, or None if it was not solved yet."""
+        if key in self.results:
+            return self.results[key]
+        if self.directory is None:
+            return None
+
+        try:
+            result, solution = json.loads(self.get_path(key).read_text())
+        except Exception:
+            return None  # Not stored, or corrupted
+        self.results[key] = (result, solution)
+        return result, solution
+
+    def put(self, key: str, result: str, solution: Any = None) -> None:
+        self.results[key] = (result, solution)
+        if self.directory is None:
+            return
+
+        try:
+            data = json.dumps([result, solution])
+        except (TypeError, ValueError):
+            return  # e.g. z3 values, only kept in memory
+        if json.loads(data) != [result, solution]:
+            return  # e.g. tuples would come back as lists
+        path = self.get_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write to a private file and rename it over the entry, so other runs never read a partial entry
+            fd, tmp_name = tempfile.mkstemp(prefix=path.name + '.', suffix='.tmp', dir=path.parent)
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.write(data)
+                os.replace(tmp_name, path)
+            except BaseException:
+                os.unlink(tmp_name)
+                raise
+        except OSError:
+            pass  # Storing is best effort
+
+
+solver_cache: Optional[SolverCache] = None
+
+
+def get_solver_cache() -> SolverCache:
+    """Returns the cache of this process, stored in Configure.solver_cache_dir if set."""
+    global solver_cache
+    if solver_cache is None:
+        solver_cache = SolverCache(Configure.solver_cache_dir)
+    return solver_cache
@@ -0,0 +1,217 @@
+import abc
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+import z3
+
+from .condtree import ConditionNode, ConditionTree, negate_condition
+from .distance import BlockDistance
+from .model import Block
+from .solver import PathKey
+
+Candidate = Tuple[List[z3.BoolRef], Optional[Block]]
+"""Path that takes a branch not tried yet, and the block the branch enters (None at the function end)."""
+
+Link = Optional[Tuple[z3.BoolRef, 'Link']]
+"""Conditions from the root to a node, last condition first, so the paths of siblings share their prefix."""
+
+
+def get_conditions(link: Link) -> List[z3.BoolRef]:
+    conditions = []
+    while link is not None:
+        cond, link = link
+        conditions.append(cond)
+    conditions.reverse()
+    return conditions
+
+
+def get_candidates(tree: ConditionTree) -> List[Candidate]:
+    """
+    All paths of tree that take a branch not tried yet, in depth-first order.
+    Like ConditionTree.get_path(), subtrees without such a path are marked as exhausted and skipped later.
+    """
+    candidates: List[Candidate] = []
+    # (node, conditions to the node, ids of the conditions, index of the first candidate of the subtree or -1)
+    stack: List[Tuple[ConditionNode, Link, PathKey, int]] = [(tree.root, None, (), -1)]
+    while len(stack) != 0:
+        node, link, key, start = stack.pop()
+        if start != -1:
+            # Children are visited
+            if len(candidates) == start:
+                node.exhausted = True
+            continue
+
+        if (
+            node.exhausted
+            or (tree.session is not None and tree.session.is_unsat(key))
+            or (node.true_child is None and node.false_child is None)
+            or (
+                node.true_child is not None
+                and node.false_child is not None
+                and not node.true_child.reachable
+                and not node.false_child.reachable
+            )
+        ):
+            node.exhausted = True
+            continue
+
+        start = len(candidates)
+        if node.true_child is None:
+            cond = node.false_child.condition
+            branch = node.false_child.parent_node.exits[0].target
+            candidates.append((get_conditions(link if cond is None else (negate_condition(cond), link)), branch))
+        elif node.false_child is None:
+            cond = node.true_child.condition
+            exits = node.true_child.parent_node.exits
+            branch = exits[1].target if len(exits) >= 2 else None
+            candidates.append((get_conditions(link if cond is None else (negate_condition(cond), link)), branch))
+
+        stack.append((node, link, key, start))
+        for child in (node.false_child, node.true_child):  # True branch is visited first
+            if child is not None and child.reachable and not child.exhausted:
+                if child.condition is None:
+                    stack.append((child, link, key, -1))
+                else:
+                    stack.append((child, (child.condition, link), key + (child.condition.get_id(),), -1))
+    return candidates
+
+
+class PathStrategy(abc.ABC):
+    """
+    Selects the path of a ConditionTree to solve next.
+
+    add_trace() is called with the path conditions of each concolic execution after they are added to the tree,
+    and get_path() is called until a solvable path is found. Unsolvable paths are added to the tree before
+    the next call.
+    """
+
+    def __init__(self, tree: ConditionTree, target_line: Optional[int] = None):
+        self.tree = tree
+        self.target_line = target_line
+
+    def add_trace(self, conditions: List[z3.BoolRef]) -> None:
+        pass
+
+    @abc.abstractmethod
+    def get_path(self) -> Optional[List[z3.BoolRef]]:
+        """
+        :return: conditions of the path, None if all paths are tried
+        """
+
+
+class DepthFirstStrategy(PathStrategy):
+    """Negates the deepest untried branch under the first branches, with ConditionTree.get_path()."""
+
+    def get_path(self) -> Optional[List[z3.BoolRef]]:
+        return self.tree.get_path()
+
+
+class BreadthFirstStrategy(PathStrategy):
+    """Negates the untried branch closest to the function entry."""
+
+    def get_path(self) -> Optional[List[z3.BoolRef]]:
+        candidates = get_candidates(self.tree)
+        if len(candidates) == 0:
+            return None
+        return min(candidates, key=lambda c: len(c[0]))[0]
+
+
+class GenerationalStrategy(PathStrategy):
+    """
+    Generational search of SAGE: every condition of an execution is negated at once, and the paths are solved
+    in the order they were generated. Conditions before the one negated to reach an execution were negated by
+    its parent generation, so only the following ones are negated again. Generated paths that the tree no longer
+    offers (under unreachable, exhausted or unsat branches, see get_candidates()) are skipped, and the depth-first
+    path is solved if no generated path is left.
+    """
+
+    def __init__(self, tree: ConditionTree, target_line: Optional[int] = None):
+        super().__init__(tree, target_line)
+        self.queue: Deque[List[z3.BoolRef]] = deque()
+        self.bound = 0  # Conditions of the next execution that are not negated
+        self.tried: Dict[int, dict] = dict()  # Trie of the ids of the conditions of executions and selected paths
+
+    def add_tried(self, path: List[z3.BoolRef]) -> None:
+        node = self.tried
+        for cond in path:
+            node = node.setdefault(cond.get_id(), dict())
+
+    def is_tried(self, path: List[z3.BoolRef]) -> bool:
+        node = self.tried
+        for cond in path:
+            if cond.get_id() not in node:
+                return False
+            node = node[cond.get_id()]
+        return True
+
+    def add_trace(self, conditions: List[z3.BoolRef]) -> None:
+        self.add_tried(conditions)
+        for i in range(self.bound, len(conditions)):
+            self.queue.append(conditions[:i] + [negate_condition(conditions[i])])
+        self.bound = 0
+
+    def get_path(self) -> Optional[List[z3.BoolRef]]:
+        path = None
+        # Conditions are hash-consed, so the ids of a generated path match the ones of the same path of the tree
+        selectable = {tuple(cond.get_id() for cond in path) for path, _ in get_candidates(self.tree)}
+        while len(self.queue) != 0:
+            candidate = self.queue.popleft()
+            if (
+                not self.is_tried(candidate)
+                and tuple(cond.get_id() for cond in candidate) in selectable
+                and (self.tree.session is None or not self.tree.session.is_unsat_prefix(candidate))
+            ):
+                path = candidate
+                break
+        if path is None:
+            path = self.tree.get_path()
+            if path is None:
+                return None
+
+        self.add_tried(path)
+        self.bound = len(path)
+        return path
+
+
+class WeightedStrategy(PathStrategy):
+    """
+    Negates the untried branch whose block is closest to the target line, then branches to blocks
+    that no execution entered, then the branch closest to the function entry.
+    """
+
+    def __init__(self, tree: ConditionTree, target_line: Optional[int] = None):
+        super().__init__(tree, target_line)
+        self.block_distance: Optional[BlockDistance] = None
+        if target_line is not None:
+            try:
+                self.block_distance = BlockDistance(tree.cfg, target_line)
+            except ValueError:
+                pass  # Not a line of this function, only coverage is used
+
+    def get_weight(self, candidate: Candidate) -> Tuple[bool, int, bool, int]:
+        path, branch = candidate
+        distance = None
+        if self.block_distance is not None and branch is not None:
+            distance = self.block_distance.distances.get(branch.id)
+        is_covered = branch is None or branch.id in self.tree.covered
+        return (distance is None, distance or 0, is_covered, len(path))
+
+    def get_path(self) -> Optional[List[z3.BoolRef]]:
+        candidates = get_candidates(self.tree)
+        if len(candidates) == 0:
+            return None
+        return min(candidates, key=self.get_weight)[0]
+
+
+STRATEGIES = {
+    'dfs': DepthFirstStrategy,
+    'bfs': BreadthFirstStrategy,
+    'generational': GenerationalStrategy,
+    'weighted': WeightedStrategy,
+}
+
+
+def create_strategy(name: str, tree: ConditionTree, target_line: Optional[int] = None) -> PathStrategy:
+    if name not in STRATEGIES:
+        raise ValueError(f'Unknown path strategy {name}, expected one of {", ".join(STRATEGIES)}')
+    return STRATEGIES[name](tree, target_line)
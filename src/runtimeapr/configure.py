@@ -1,3 +1,11 @@
 class Configure:
     debug:bool = False
-    max_recursive:int = 20
\ No newline at end of file
+    max_recursive:int = 20
+    fuzz_jobs:int = 1
+    fork_execution:bool = False
+    fuzz_coverage:bool = False
+    fuzz_directed:bool = False
+    corpus_dir:str = None
+    solver_cache_dir:str = None
+    solver_jobs:int = 1
+    path_strategy:str = 'dfs'
\ No newline at end of file
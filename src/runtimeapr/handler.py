@@ -0,0 +1,170 @@
+"""Entry point of the except blocks inserted by Instrumenter.insert_try_except."""
+import builtins
+import dis
+import os
+from types import CodeType, FrameType
+from typing import Dict, List, Optional, Tuple
+
+HANDLER_NAME = '__runtime_apr_except_handler__'
+IGNORED_NAME = '__runtime_apr_ignored_exceptions__'
+
+# Exceptions used by the interpreter for control flow, e.g. StopIteration raised from __next__
+IGNORED_EXCEPTIONS = (StopIteration, StopAsyncIteration)
+
+PACKAGE_DIR = os.path.dirname(__file__)
+EXCEPT_HANDLER = -1  # Block pushed while an except or finally block runs, see get_blocks()
+
+loop = None  # runtimeapr.loop, imported on the first exception
+blocks_cache: Dict[CodeType, Dict[int, Tuple[int, ...]]] = {}
+instructions_cache: Dict[CodeType, Tuple[List[dis.Instruction], Dict[int, int]]] = {}
+
+
+def get_instructions(code: CodeType) -> Tuple[List[dis.Instruction], Dict[int, int]]:
+    """Instructions of code, and their indices by offset."""
+    if code not in instructions_cache:
+        instrs = list(dis.get_instructions(code))
+        instructions_cache[code] = (instrs, {instr.offset: i for i, instr in enumerate(instrs)})
+    return instructions_cache[code]
+
+
+def get_blocks(code: CodeType) -> Dict[int, Tuple[int, ...]]:
+    """
+    Offsets of the instructions of code -> targets of the SETUP_FINALLY blocks around them, innermost last.
+
+    Instrumented code only runs on Python 3.10 and earlier, where handlers are set up with SETUP_FINALLY
+    and the block stack of an instruction follows from the paths that reach it.
+    """
+    if code in blocks_cache:
+        return blocks_cache[code]
+
+    instrs = {instr.offset: instr for instr in get_instructions(code)[0]}
+    blocks: Dict[int, Tuple[int, ...]] = {}
+    todo: List[Tuple[int, Tuple[int, ...]]] = [(0, ())]
+    handlers: List[Tuple[int, Tuple[int, ...]]] = []  # Visited after normal paths, which pop EXCEPT_HANDLER
+    while len(todo) != 0 or len(handlers) != 0:
+        offset, stack = todo.pop() if len(todo) != 0 else handlers.pop(0)
+        while offset in instrs and offset not in blocks:
+            blocks[offset] = stack
+            instr = instrs[offset]
+            if instr.opname == 'SETUP_FINALLY':
+                handlers.append((instr.argval, stack + (EXCEPT_HANDLER,)))
+                stack = stack + (instr.argval,)
+            elif instr.opname in ('SETUP_WITH', 'SETUP_ASYNC_WITH'):
+                handlers.append((instr.argval, stack + (EXCEPT_HANDLER,)))
+                stack = stack + (EXCEPT_HANDLER,)  # __exit__ may suppress, but is not a handler
+            elif instr.opname == 'POP_BLOCK' and len(stack) != 0:
+                stack = stack[:-1]
+            elif instr.opname == 'POP_EXCEPT' and len(stack) != 0 and stack[-1] == EXCEPT_HANDLER:
+                stack = stack[:-1]
+
+            if instr.opname in ('RETURN_VALUE', 'RAISE_VARARGS', 'RERAISE'):
+                break
+            if (instr.opcode in dis.hasjabs or instr.opcode in dis.hasjrel) and not instr.opname.startswith('SETUP_'):
+                todo.append((instr.argval, stack))
+                if instr.opname in ('JUMP_ABSOLUTE', 'JUMP_FORWARD'):
+                    break
+            offset += 2
+
+    blocks_cache[code] = blocks
+    return blocks
+
+
+def eval_exception_types(instrs: List[dis.Instruction], frame: FrameType):
+    """Evaluates the expression of an except clause, None if it is not a plain name, attribute or tuple of them."""
+    stack = []
+    for instr in instrs:
+        if instr.opname in ('LOAD_GLOBAL', 'LOAD_NAME', 'LOAD_FAST', 'LOAD_DEREF', 'LOAD_CLASSDEREF'):
+            for namespace in (frame.f_locals, frame.f_globals, vars(builtins)):
+                if instr.argval in namespace and (instr.opname != 'LOAD_GLOBAL' or namespace is not frame.f_locals):
+                    stack.append(namespace[instr.argval])
+                    break
+            else:
+                return None
+        elif instr.opname == 'LOAD_ATTR' and len(stack) != 0:
+            if not hasattr(stack[-1], instr.argval):
+                return None
+            stack.append(getattr(stack.pop(), instr.argval))
+        elif instr.opname == 'BUILD_TUPLE' and len(stack) >= instr.arg:
+            items = tuple(stack[len(stack) - instr.arg:])
+            del stack[len(stack) - instr.arg:]
+            stack.append(items)
+        else:
+            return None
+    return stack[-1] if len(stack) == 1 else None
+
+
+def reraises(code: CodeType, instrs: List[dis.Instruction], start: int) -> bool:
+    """True if the except clause whose body starts at instrs[start] has a bare raise of its own."""
+    blocks = get_blocks(code)
+    entry = blocks.get(instrs[start].offset)
+    if entry is None:
+        return False
+    for instr in instrs[start:]:
+        stack = blocks.get(instr.offset)
+        if stack is None or stack[:len(entry)] != entry:
+            continue
+        if instr.opname == 'POP_EXCEPT' and stack == entry:
+            return False  # End of the clause
+        # A raise in a nested except block re-raises the nested exception
+        if instr.opname == 'RAISE_VARARGS' and instr.arg == 0 and EXCEPT_HANDLER not in stack[len(entry):]:
+            return True
+    return False
+
+
+def handles(code: CodeType, target: int, frame: FrameType, e: BaseException) -> bool:
+    """True if the except clauses of the handler at offset target catch e without re-raising it."""
+    instrs, index = get_instructions(code)
+    i = index[target]
+    if [instr.opname for instr in instrs[i:i + 3]] == ['POP_TOP'] * 3:
+        return not reraises(code, instrs, i)  # Bare except
+    while instrs[i].opname == 'DUP_TOP':
+        end = i + 1
+        while end < len(instrs) and instrs[end].opname not in ('COMPARE_OP', 'JUMP_IF_NOT_EXC_MATCH'):
+            end += 1
+        if end == len(instrs):
+            return False
+        types = eval_exception_types(instrs[i + 1:end], frame)
+        next_clause = instrs[end + 1].argval if instrs[end].opname == 'COMPARE_OP' else instrs[end].argval
+        try:
+            matched = types is not None and isinstance(e, types)
+        except TypeError:
+            matched = False
+        if matched:
+            return not reraises(code, instrs, end + 1 if instrs[end].opname == 'JUMP_IF_NOT_EXC_MATCH' else end + 2)
+        i = index[next_clause]
+    # No clause matched, or a finally block
+    return False
+
+
+def is_handled(frame: Optional[FrameType], e: BaseException) -> bool:
+    """True if a try/except of frame or a frame calling it catches e, so e is not a crash of the program."""
+    while frame is not None:
+        code = frame.f_code
+        if not code.co_filename.startswith(PACKAGE_DIR):
+            blocks = get_blocks(code).get(frame.f_lasti, ())
+            if '__runtime_apr__' in code.co_consts:
+                blocks = blocks[1:]  # try/except inserted by Instrumenter.insert_try_except
+            for target in reversed(blocks):
+                if target != EXCEPT_HANDLER and handles(code, target, frame, e):
+                    return True
+        frame = frame.f_back
+    return False
+
+
+def except_handler(e: Exception):
+    global loop
+    # The frame of the instrumented function is the caller; its own handlers have already been tried
+    if e.__traceback__ is not None and is_handled(e.__traceback__.tb_frame.f_back, e):
+        raise e
+    if loop is None:
+        from . import loop
+    return loop.except_handler(e)
+
+
+def install(namespace: dict):
+    """
+    Binds the names loaded by instrumented code in the globals of a module, once before the module runs.
+    Instrumented code finds them with LOAD_GLOBAL without an import, and marshalled code keeps working.
+    """
+    namespace[HANDLER_NAME] = except_handler
+    namespace[IGNORED_NAME] = IGNORED_EXCEPTIONS
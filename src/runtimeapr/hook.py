@@ -0,0 +1,113 @@
+import sys
+import threading
+from types import CodeType
+from typing import Any, Callable, Dict, Optional
+
+PYTHON_VERSION = sys.version_info[:2]
+
+
+class ExceptionHook:
+    """
+    Exception capture backend that does not rewrite bytecode.
+
+    Calls runtimeapr.loop.except_handler once for each exception that escapes a function in a matched file,
+    which is where the try/except inserted by Instrumenter.insert_try_except would catch it.
+    On Python 3.12+ this uses sys.monitoring PY_UNWIND events, which cost nothing until an exception unwinds;
+    older versions fall back to sys.settrace with line events disabled for matched frames.
+
+    The hook only reports exceptions: the interpreter gives no way to resume an unwinding frame, so the exception
+    keeps propagating after the handler returns and the handler's return value, which the bytecode backend
+    returns from the function instead, is discarded. An exception raised by the handler is not propagated either.
+    """
+
+    def __init__(self, file_matcher=None, handler: Optional[Callable[[Exception], Any]] = None):
+        self.file_matcher = file_matcher  # RuntimeAPRFileMatcher, or None to match everything
+        self.handler = handler
+        self.matched: Dict[str, bool] = dict()  # co_filename -> matched by file_matcher
+        self.last_exception = None  # Exception already handled while it unwinds outer frames
+        self.handling = False
+        self.pending = dict()  # frame -> (f_lasti, exception) raised in the frame, for settrace
+        self.tool_id: Optional[int] = None  # sys.monitoring tool id, for 3.12+
+
+    def matches(self, code: CodeType):
+        filename = code.co_filename
+        if filename not in self.matched:
+            self.matched[filename] = self.file_matcher is None or self.file_matcher.matches(filename)
+        return self.matched[filename]
+
+    def handle(self, e: BaseException):
+        # Same as 'except Exception' of the bytecode backend
+        if not isinstance(e, Exception) or e is self.last_exception or self.handling:
+            return
+
+        self.last_exception = e
+        if self.handler is None:
+            from .loop import except_handler
+
+            self.handler = except_handler
+
+        self.handling = True
+        try:
+            self.handler(e)  # Report-only, see the class docstring
+        except BaseException as handler_error:
+            # except_handler re-raises e during concolic execution, which unwinds anyway
+            if handler_error is not e:
+                print(f'Exception hook failed: {handler_error!r}', file=sys.stderr)
+        finally:
+            self.handling = False
+
+    def _on_unwind(self, code: CodeType, instruction_offset: int, exception: BaseException):
+        if self.matches(code):
+            self.handle(exception)
+
+    def _trace(self, frame, event, arg):
+        if event == 'call' and self.matches(frame.f_code):
+            frame.f_trace_lines = False
+            return self._trace_frame
+        return None
+
+    def _trace_frame(self, frame, event, arg):
+        if event == 'exception':
+            self.pending[frame] = (frame.f_lasti, arg[1])
+        elif event == 'return':
+            raised = self.pending.pop(frame, None)
+            # A frame returning at the instruction that raised is unwinding; otherwise the exception was handled
+            if raised is not None and raised[0] == frame.f_lasti:
+                self.handle(raised[1])
+        return self._trace_frame
+
+    def install(self):
+        if PYTHON_VERSION >= (3, 12):
+            monitoring = sys.monitoring
+            # Do not take over the id of an attached debugger, e.g. pdb
+            free_ids = [tool_id for tool_id in range(6) if monitoring.get_tool(tool_id) is None]
+            if len(free_ids) == 0:
+                raise RuntimeError('No free sys.monitoring tool id for the exception hook')
+            self.tool_id = monitoring.DEBUGGER_ID if monitoring.DEBUGGER_ID in free_ids else free_ids[-1]
+            monitoring.use_tool_id(self.tool_id, 'runtimeapr')
+            monitoring.register_callback(self.tool_id, monitoring.events.PY_UNWIND, self._on_unwind)
+            monitoring.set_events(self.tool_id, monitoring.events.PY_UNWIND)
+        else:
+            threading.settrace(self._trace)
+            sys.settrace(self._trace)
+
+    def uninstall(self):
+        if PYTHON_VERSION >= (3, 12):
+            if self.tool_id is None:
+                return
+            monitoring = sys.monitoring
+            monitoring.set_events(self.tool_id, monitoring.events.NO_EVENTS)
+            monitoring.register_callback(self.tool_id, monitoring.events.PY_UNWIND, None)
+            monitoring.free_tool_id(self.tool_id)
+            self.tool_id = None
+        else:
+            sys.settrace(None)
+            threading.settrace(None)
+            self.pending.clear()
+
+    def __enter__(self) -> "ExceptionHook":
+        self.install()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.uninstall()
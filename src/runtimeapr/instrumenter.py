@@ -1,23 +1,80 @@
 from types import CodeType
 from bytecode import Instr, Bytecode, Label, dump_bytecode, Compare
+import inspect
 import sys
 import os
 
+from . import handler
+from .lazy import set_instrumenter
+
 PYTHON_VERSION = sys.version_info[:2]
+LAZY_MARKER = '__runtime_apr_lazy__'
+TRAMPOLINE_SIZE = 10  # Number of Instrs inserted by insert_trampoline
 
 
 class Instrumenter:
-    def __init__(self, is_script_mode: bool = False, throw_exception_when_error: bool = False):
+    def __init__(self, is_script_mode: bool = False, throw_exception_when_error: bool = False, lazy: bool = False):
         self.delta = 0
         self.skip_next_insert = False
         self.next_label = None
         self.is_script_mode = is_script_mode
         self.throw_exception_when_error = throw_exception_when_error
+        self.lazy = lazy  # Instrument nested functions on their first call
 
         self.block_stack = []  # This contains Instrs that may need POP_BLOCK to check exception is already handled
         self.handled_exceptions = set()  # This contains exceptions that are already handled
         self.code_stack = []
 
+        if lazy:
+            set_instrumenter(self)
+
+    def get_options(self):
+        """Returns the options that affect the code generated by insert_try_except."""
+        return {'throw_exception_when_error': self.throw_exception_when_error, 'lazy': self.lazy}
+
+    def is_lazy_candidate(self, code: CodeType):
+        # Only named functions; module, class bodies, lambdas and comprehensions are instrumented eagerly
+        if not (self.lazy and code.co_flags & inspect.CO_OPTIMIZED and not code.co_name.startswith('<')):
+            return False
+        # Functions nested in a function are instrumented with it, new closures would hit the trampoline
+        return not any(bc.flags & inspect.CO_OPTIMIZED for bc in self.code_stack)
+
+    def insert_trampoline(self, code: CodeType):
+        """
+        Prepends a call to runtimeapr.lazy.instrument_on_first_call to the function,
+        which replaces the function's code with insert_try_except(code) when it is first called.
+        The call that triggers the trampoline itself runs uninstrumented; exceptions from it
+        are still handled by the (instrumented) caller.
+        """
+        bc = Bytecode.from_code(code)
+        lineno = next(instr.lineno for instr in bc if isinstance(instr, Instr))
+        trampoline = [
+            Instr('LOAD_CONST', LAZY_MARKER, lineno=lineno),
+            Instr('POP_TOP', lineno=lineno),
+            Instr('LOAD_CONST', 0, lineno=lineno),
+            Instr('LOAD_CONST', ('instrument_on_first_call',), lineno=lineno),
+            Instr('IMPORT_NAME', 'runtimeapr.lazy', lineno=lineno),
+            Instr('IMPORT_FROM', 'instrument_on_first_call', lineno=lineno),
+            Instr('ROT_TWO', lineno=lineno),
+            Instr('POP_TOP', lineno=lineno),
+            Instr('CALL_FUNCTION', 0, lineno=lineno),
+            Instr('POP_TOP', lineno=lineno),  # Until now: instrument_on_first_call()
+        ]
+        assert len(trampoline) == TRAMPOLINE_SIZE
+
+        new_bytecode = Bytecode(trampoline + list(bc))
+        new_bytecode._copy_attr_from(bc)
+        return new_bytecode.to_code()
+
+    def remove_trampoline(self, code: CodeType):
+        bc = Bytecode.from_code(code)
+        if not (isinstance(bc[0], Instr) and bc[0].name == 'LOAD_CONST' and bc[0].arg == LAZY_MARKER):
+            return code
+
+        new_bytecode = Bytecode(list(bc)[TRAMPOLINE_SIZE:])
+        new_bytecode._copy_attr_from(bc)
+        return new_bytecode.to_code()
+
     def _get_handled_exception(self, setup_finally_instr: Instr):
         except_label: Label = setup_finally_instr.arg
         for code in self.code_stack:
@@ -46,6 +103,8 @@ class Instrumenter:
         return set()
 
     def insert_try_except(self, code: CodeType):
+        if LAZY_MARKER in code.co_consts:
+            code = self.remove_trampoline(code)
         bc = Bytecode.from_code(code)
         is_global = bc.name == '<module>'
         # Skip if already instrumented
@@ -62,6 +121,7 @@ class Instrumenter:
         except_label = Label()
         dummy_label = Label()
         except_exception_label = Label()
+        handled_label = Label()
 
         # # TODO: Store func entry: remove later
         # if 'FUNC_NAME' in os.environ:
@@ -94,8 +154,14 @@ class Instrumenter:
                 and instr.arg.co_filename == code.co_filename
                 and '__runtime_apr__' not in instr.arg.co_consts
             ):
-                # Instrument nested CodeType
-                new_bc.append(Instr('LOAD_CONST', self.insert_try_except(instr.arg), lineno=instr.lineno))
+                if LAZY_MARKER in instr.arg.co_consts and self.is_lazy_candidate(instr.arg):
+                    new_bc.append(instr)
+                elif self.is_lazy_candidate(instr.arg):
+                    # Instrument nested function when it is called
+                    new_bc.append(Instr('LOAD_CONST', self.insert_trampoline(instr.arg), lineno=instr.lineno))
+                else:
+                    # Instrument nested CodeType
+                    new_bc.append(Instr('LOAD_CONST', self.insert_try_except(instr.arg), lineno=instr.lineno))
             elif isinstance(instr, Instr) and instr.name == 'RETURN_VALUE':
                 new_bc.append(Instr('POP_BLOCK', lineno=cur_lineno))
                 new_bc.append(instr)
@@ -112,6 +178,18 @@ class Instrumenter:
             except_block.append(
                 Instr('JUMP_IF_NOT_EXC_MATCH', dummy_label, lineno=cur_lineno)
             )  # Jump if current Exception is not Exception
+
+        # Skip exceptions used for control flow, e.g. StopIteration from __next__
+        except_block.append(Instr('DUP_TOP', lineno=cur_lineno))
+        except_block.append(Instr('LOAD_GLOBAL', handler.IGNORED_NAME, lineno=cur_lineno))
+        if PYTHON_VERSION[1] <= 8:
+            except_block.append(Instr('COMPARE_OP', Compare.EXC_MATCH, lineno=cur_lineno))
+            except_block.append(Instr('POP_JUMP_IF_TRUE', dummy_label, lineno=cur_lineno))
+        else:
+            except_block.append(Instr('JUMP_IF_NOT_EXC_MATCH', handled_label, lineno=cur_lineno))
+            except_block.append(Instr('JUMP_ABSOLUTE', dummy_label, lineno=cur_lineno))
+            except_block.append(handled_label)
+
         except_block.append(Instr('POP_TOP', lineno=cur_lineno))
         if is_global:
             except_block.append(Instr('STORE_NAME', '_sc_e', lineno=cur_lineno))
@@ -124,23 +202,8 @@ class Instrumenter:
         )  # Exception in except block
         if self.throw_exception_when_error:  # Raise original exception if option specified
             except_block.append(Instr('RAISE_VARARGS', 0, lineno=cur_lineno))
-        except_block.append(Instr('LOAD_CONST', 0, lineno=instr.lineno))
-        except_block.append(Instr('LOAD_CONST', ('except_handler',), lineno=instr.lineno))
-        except_block.append(Instr('IMPORT_NAME', 'runtimeapr.loop', lineno=instr.lineno))
-        except_block.append(Instr('IMPORT_FROM', 'except_handler', lineno=instr.lineno))
-
-        if is_global:
-            except_block.append(Instr('STORE_NAME', 'except_handler', lineno=cur_lineno))
-        else:
-            except_block.append(Instr('STORE_FAST', 'except_handler', lineno=cur_lineno))
-        except_block.append(
-            Instr('POP_TOP', lineno=instr.lineno)
-        )  # Until now: from slipcover.loop import except_handler
-
-        if is_global:
-            except_block.append(Instr('LOAD_NAME', 'except_handler', lineno=cur_lineno))
-        else:
-            except_block.append(Instr('LOAD_FAST', 'except_handler', lineno=cur_lineno))
+        # Bound in the module's globals by runtimeapr.handler.install, no import per exception
+        except_block.append(Instr('LOAD_GLOBAL', handler.HANDLER_NAME, lineno=cur_lineno))
         if is_global:
             except_block.append(Instr('LOAD_NAME', '_sc_e', lineno=cur_lineno))
         else:
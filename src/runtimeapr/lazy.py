@@ -0,0 +1,67 @@
+"""
+Instruments functions trampolined by Instrumenter.insert_trampoline on their first call.
+
+Only functions defined in module and class bodies are trampolined; functions nested in them are instrumented
+together with their enclosing function, so closures never go through the trampoline.
+The call that triggers the trampoline runs the original, uninstrumented body. An exception raised by it
+is handled by the instrumented caller, and later calls run the instrumented code.
+"""
+import gc
+import sys
+from types import CodeType, FunctionType
+from typing import Dict, List
+
+from . import registry
+
+instrumenter = None  # Instrumenter used for lazily instrumented functions
+instrumented_codes: Dict[CodeType, CodeType] = {}  # Trampolined code -> instrumented code
+trampolined_functions: Dict[CodeType, List[FunctionType]] = {}  # Trampolined code -> functions not patched yet
+
+
+def set_instrumenter(sci):
+    global instrumenter
+    instrumenter = sci
+
+
+def index_functions(f_globals: dict) -> None:
+    from .instrumenter import LAZY_MARKER
+    from .slipcover import Slipcover
+
+    # Module level functions and methods are reachable from globals
+    for func in Slipcover.find_functions(list(f_globals.values()), set()):
+        if LAZY_MARKER in func.__code__.co_consts:
+            funcs = trampolined_functions.setdefault(func.__code__, [])
+            if func not in funcs:
+                funcs.append(func)
+
+
+def find_functions(code: CodeType, f_globals: dict) -> List[FunctionType]:
+    if code not in trampolined_functions:
+        # Defined after the globals were indexed
+        index_functions(f_globals)
+    funcs = trampolined_functions.pop(code, None)
+    if funcs:
+        return funcs
+
+    # Functions not reachable from globals, e.g. replaced by a decorator; slow path
+    return [obj for obj in gc.get_referrers(code) if isinstance(obj, FunctionType) and obj.__code__ is code]
+
+
+def instrument_on_first_call():
+    global instrumenter
+    frame = sys._getframe(1)
+    code = frame.f_code
+
+    new_code = instrumented_codes.get(code)
+    if new_code is None:
+        if instrumenter is None:
+            from .instrumenter import Instrumenter
+
+            instrumenter = Instrumenter(lazy=True)
+        new_code = instrumenter.insert_try_except(code)
+        instrumented_codes[code] = new_code
+
+    # The current call continues with the trampolined code, later calls are instrumented
+    for func in find_functions(code, frame.f_globals):
+        func.__code__ = new_code
+        registry.register(func)
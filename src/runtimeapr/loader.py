@@ -3,16 +3,19 @@ from importlib import machinery
 from importlib.abc import Loader, MetaPathFinder
 from pathlib import Path
 import sys
-from typing import Any
+from typing import Any, Optional
 
+from . import handler, registry
+from .codecache import CodeCache
 from .instrumenter import Instrumenter
 
 
 class RuntimeAPRLoader(Loader):
-    def __init__(self, sci: Instrumenter, orig_loader: Loader, origin: str):
+    def __init__(self, sci: Instrumenter, orig_loader: Loader, origin: str, cache: Optional[CodeCache] = None):
         self.sci = sci                  # Instrumenter object
         self.orig_loader = orig_loader  # original loader we're wrapping
         self.origin = Path(origin)      # module origin (source file for a source loader)
+        self.cache = cache              # cache of instrumented code, if enabled
 
         # loadlib checks for this attribute to see if we support it... keep in sync with orig_loader
         if not getattr(self.orig_loader, "get_resource_reader", None):
@@ -29,20 +32,39 @@ class RuntimeAPRLoader(Loader):
         return self.orig_loader.get_code(name)
 
     def exec_module(self, module):
+        key = None  # cache key, if the instrumented code may be cached
         if isinstance(self.orig_loader, machinery.SourceFileLoader) and self.origin.exists():
-            code = compile(ast.parse(self.origin.read_text()), str(self.origin), "exec")
+            source = self.origin.read_bytes()
+            if self.cache is not None:
+                key = self.cache.get_key(source, self.sci)
+                code = self.cache.load(self.origin, key)
+                if code is not None:
+                    self.exec_code(code, module)
+                    return
+
+            code = compile(ast.parse(source), str(self.origin), "exec")
         else:
             code = self.orig_loader.get_code(module.__name__)
 
         if '__runtime_apr__' not in code.co_consts:
             code = self.sci.insert_try_except(code)
+            if key is not None:
+                self.cache.store(self.origin, key, code)
+        self.exec_code(code, module)
+
+    def exec_code(self, code, module):
+        handler.install(module.__dict__)
+        registry.add_namespace(module.__dict__)
         exec(code, module.__dict__)
+        # so that except_handler finds the functions of this module without scanning the heap
+        registry.register_namespace(module.__dict__)
 
 class RuntimeAPRMetaPathFinder(MetaPathFinder):
-    def __init__(self, sci, file_matcher, debug=False):
+    def __init__(self, sci, file_matcher, debug=False, cache=None):
         self.debug = debug
         self.sci = sci
         self.file_matcher = file_matcher
+        self.cache = cache
 
     def find_spec(self, fullname, path, target=None):
         if self.debug:
@@ -66,7 +88,7 @@ class RuntimeAPRMetaPathFinder(MetaPathFinder):
 
             if self.file_matcher.matches(spec.origin):
                 print(f"instrumenting {fullname} from {spec.origin}")
-                spec.loader = RuntimeAPRLoader(self.sci, spec.loader, spec.origin)
+                spec.loader = RuntimeAPRLoader(self.sci, spec.loader, spec.origin, self.cache)
 
             return spec
 
@@ -133,8 +155,10 @@ class RuntimeAPRFileMatcher:
 class RuntimeAPRImportManager:
     """A context manager that enables instrumentation while active."""
 
-    def __init__(self, sci: Instrumenter, file_matcher: RuntimeAPRFileMatcher = None, debug: bool = False):
-        self.mpf = RuntimeAPRMetaPathFinder(sci, file_matcher if file_matcher else RuntimeAPRMatchEverything(), debug)
+    def __init__(self, sci: Instrumenter, file_matcher: RuntimeAPRFileMatcher = None, debug: bool = False,
+                 cache: CodeCache = None):
+        self.mpf = RuntimeAPRMetaPathFinder(sci, file_matcher if file_matcher else RuntimeAPRMatchEverything(), debug,
+                                            cache)
 
     def __enter__(self) -> "RuntimeAPRImportManager":
         sys.meta_path.insert(0, self.mpf)
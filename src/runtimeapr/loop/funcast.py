@@ -1,5 +1,9 @@
 import ast
-from typing import Any, List
+from typing import Any, List, Union
+
+def get_start_lineno(node:Union[ast.FunctionDef,ast.AsyncFunctionDef]) -> int:
+    # The first decorator may span several lines, so the start is not lineno-len(decorator_list)
+    return node.decorator_list[0].lineno if len(node.decorator_list)!=0 else node.lineno
 
 class FunctionFinderVisitor(ast.NodeVisitor):
     def __init__(self,buggy_line) -> None:
@@ -8,11 +12,11 @@ class FunctionFinderVisitor(ast.NodeVisitor):
         super().__init__()
     
     def visit_FunctionDef(self, node: ast.FunctionDef) -> Any:
-        if node.lineno-len(node.decorator_list)<=self.buggy_line<=node.end_lineno:
+        if get_start_lineno(node)<=self.buggy_line<=node.end_lineno:
             self.functiondefs.append(node)
     
     def visit_AsyncFunctionDef(self, node: ast.AsyncFunctionDef) -> Any:
-        if node.lineno-len(node.decorator_list)<=self.buggy_line<=node.end_lineno:
+        if get_start_lineno(node)<=self.buggy_line<=node.end_lineno:
             self.functiondefs.append(node)
     
     def get_funcs(self):
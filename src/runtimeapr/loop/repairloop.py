@@ -18,24 +18,29 @@ from openai import OpenAI
 from bytecode import Bytecode,dump_bytecode
 
 from ..concolic.fuzzing import Fuzzer
-from .funcast import FunctionFinderVisitor
-from .repairutils import BugInformation,prune_default_global_var,is_default_global,compare_object,pickle_object,prune_default_local_var,is_default_local,convert_json
+from .repairutils import BugInformation,prune_default_global_var,is_default_global,compare_object,pickle_object,prune_default_local_var,is_default_local,convert_json,SnapshotMemo
 from ..concolic import ConcolicTracer,get_zvalue,zint,symbolize,ControlDependenceGraph,Block,ConditionTree,ConditionNode,DefUseGraph
 from ..configure import Configure
+from ..registry import lookup as lookup_function
+from ..sourceindex import get_index
 from ..concolic.restate import StateReproducer
 from ..concolic.defusegraph import DependencyGraph
+from ..concolic.solver import PORTFOLIO_START,SolverCache,SolverSession,get_independent_groups,get_model_values,get_solver_cache,solve_portfolio
+from ..concolic.ConcolicTracer import Z3_TIMEOUT
+from ..concolic.strategy import PathStrategy,create_strategy
 
 is_concolic_execution=False
 use_criu = False
 
 class RepairloopRunner:
-    def __init__(self, fn:FunctionType, args, kwargs, bug_info:BugInformation,target_func:ast.FunctionDef,func_code:str):
+    def __init__(self, fn:FunctionType, args, kwargs, bug_info:BugInformation,target_func:ast.FunctionDef,func_code:str,strategy:str=None):
         """
         :param fn: function to run
         :param args: arguments to pass to the function
         :param kwargs: keyword arguments to pass to the function
         :param local_vars: local variables from buggy function
         :param global_vars: global variables from buggy function
+        :param strategy: name of the path exploration strategy in STRATEGIES, Configure.path_strategy if None
         """
         self.fn=fn
         self.target_func=target_func
@@ -59,7 +64,11 @@ class RepairloopRunner:
         # def_use_graph:DefUseGraph=DefUseGraph(self.fn)
         # self.defines=def_use_graph.entries
         self.defines:Dict[str,List[str]]=DependencyGraph(self.fn).get_deps()
-        self.cond_tree:ConditionTree=ConditionTree(self.cfg.cfg)
+        # Created by get_buggy_values(), loop() does not run concolic execution
+        self.strategy_name:str=strategy or Configure.path_strategy
+        self.solver_session:Optional[SolverSession]=None
+        self.cond_tree:Optional[ConditionTree]=None
+        self.path_strategy:Optional[PathStrategy]=None
         self.skip_global:bool=False # Skip global variables
 
         # To record local and global variables at target function return
@@ -178,42 +187,90 @@ class RepairloopRunner:
     def get_z3_values(self,path):
         """
         Compute values from z3 path constraints.
+        Conditions on disjoint variables are solved separately and their values merged, so the groups solved
+        for previous paths are answered by the solver cache and only the new groups are solved.
+        The group of the negated condition usually extends the one solved for the last path, so it is solved
+        in the incremental session; other new groups are solved on their own so the session keeps its scopes.
         :param path: list of z3 path constraints
         :return: values of variables
         """
-        solver=z3.Solver()
-        solver.add(path)
         # for pers_path in self.persistent_path:
         #     solver.add(pers_path)
         
-        if solver.check()==z3.unsat:
-            print(f'Not solvable: {path}')
-            return None
-        
-        model=solver.model()
-        print(f'Model: {model}')
+        cache=get_solver_cache()
         values:Dict[str,object]=dict()
-
-        for i in range(len(model)):
-            if isinstance(model[i],z3.FuncDeclRef):
-                cur_value=model[model[i]]
-                # TODO: Add more types
-                if isinstance(cur_value,z3.IntNumRef):
-                    values[model[i].name()]=cur_value.as_long()
-                elif isinstance(cur_value,z3.BoolRef):
-                    if cur_value.num_args()==0:
-                        values[model[i].name()]=False
-                    else:
-                        values[model[i].name()]=cur_value.arg(0)
-                elif isinstance(cur_value,z3.RatNumRef):
-                    values[model[i].name()]=float(cur_value.as_decimal(10))
-                elif isinstance(cur_value,z3.SeqRef):
-                    values[model[i].name()]=cur_value.as_string()
-                else:
-                    values[model[i].name()]=cur_value
+        missing=[]  # Groups not solved before
+        for group in get_independent_groups(path):
+            cached=cache.get(SolverCache.get_key(group,'values'))
+            if cached is None:
+                missing.append(group)
+            elif cached[0]=='unsat':
+                print(f'Not solvable: {path}')
+                self.solver_session.add_unsat(path)
+                return None
+            else:
+                values.update(cached[1])
+
+        is_negated=lambda group:any(cond is path[-1] for cond in group)
+        # Solve the group of the negated condition first to find unsolvable paths early
+        missing.sort(key=lambda group:not is_negated(group))
+        for group in missing:
+            result,group_values=self.solve_values(group,incremental=is_negated(group))
+            if result==z3.unknown:
+                # Not known to be unsat, the path may be solved later
+                print(f'Solver gave up: {path}')
+                return None
+            if result==z3.unsat:
+                print(f'Not solvable: {path}')
+                self.solver_session.add_unsat(path)
+                return None
+            values.update(group_values)
 
         print(f'Values: {values}')
         return values
+
+    def solve_values(self,path,incremental=True):
+        """
+        Solve path constraints.
+        :param path: list of z3 path constraints
+        :param incremental: solve in the incremental session, otherwise in a solver of its own
+        :return: z3.sat with the values of variables, z3.unsat or z3.unknown (e.g. a timeout) with None
+        """
+        # Same or equivalent paths may be solved in previous trials
+        cache=get_solver_cache()
+        key=SolverCache.get_key(path,'values')
+        cached=cache.get(key)
+        if cached is not None:
+            return (z3.sat,cached[1]) if cached[0]=='sat' else (z3.unsat,None)
+
+        if incremental:
+            solver=None
+            result=self.solver_session.check(path)
+        else:
+            solver=z3.Solver()
+            if self.solver_session.timeout is not None:
+                solver.set('timeout',self.solver_session.timeout)
+            solver.add(*path)
+            result=solver.check()
+        if result==z3.unknown and Configure.solver_jobs>1:
+            portfolio_result,portfolio_values=solve_portfolio(path,Z3_TIMEOUT,Configure.solver_jobs)
+            if portfolio_result=='sat':
+                values={name:value for name,(value,_) in portfolio_values.items()}
+                cache.put(key,'sat',values)
+                return z3.sat,values
+            elif portfolio_result=='unsat':
+                result=z3.unsat
+        if result==z3.unknown:
+            return z3.unknown,None  # Not cached, may be solved with more time
+        if result==z3.unsat:
+            cache.put(key,'unsat')
+            return z3.unsat,None
+        
+        model=self.solver_session.model() if solver is None else solver.model()
+        print(f'Model: {model}')
+        values=get_model_values(model)
+        cache.put(key,'sat',values)
+        return z3.sat,values
             
     def get_buggy_values(self):
         """
@@ -221,9 +278,18 @@ class RepairloopRunner:
         Keep running concolic execution until the values are the same as buggy values.
         :return: buggy values of arguments and global variables
         """
+        if self.path_strategy is None:
+            # Paths from the condition tree share prefixes, solve them incrementally
+            # With a portfolio, hard paths are given up early in process and raced in get_z3_values()
+            self.solver_session=SolverSession(PORTFOLIO_START if Configure.solver_jobs>1 else None)
+            self.cond_tree=ConditionTree(self.cfg.cfg,self.solver_session)
+            self.path_strategy=create_strategy(self.strategy_name,self.cond_tree,self.bug_info.buggy_line)
+
         is_same=False
         paths=list()
         before_values:Dict[str,object]=dict()
+        MAX_UNKNOWN_TRIES=3
+        unknown_tries:Dict[str,int]=dict() # Key of a path in SolverCache -> times the solver gave up on it
 
         while not is_same:
             self.trial+=1
@@ -236,6 +302,7 @@ class RepairloopRunner:
                 is_same=True
             else:
                 self.cond_tree.update_tree(cur_paths)
+                self.path_strategy.add_trace(cur_paths)
 
             if not is_same:
                 if len(cur_locals)!=0 or len(cur_globals)!=0:
@@ -249,20 +316,27 @@ class RepairloopRunner:
                 # Combine all paths into multiple Ands
                 simple_path=z3.simplify(z3.And(*cur_paths))
 
-                # self.cond_tree.update_unreachable_conds(self.bug_info.buggy_line)
+                # Branches that cannot reach the line of the exception are not negated
+                self.cond_tree.update_unreachable_conds(self.bug_info.buggy_line)
                 print(f'Condition tree:\n{self.cond_tree}')
 
                 before_values=None
                 while before_values is None:
                     # Negate the path
-                    new_path=self.cond_tree.get_path()
+                    new_path=self.path_strategy.get_path()
                     assert new_path is not None,f'Failed to negate {simple_path}'
 
                     # Solve the SMT and get the values
                     before_values=self.get_z3_values(new_path)
                     if before_values is None:
+                        if not self.solver_session.is_unsat_prefix(new_path):
+                            # The solver gave up (e.g. a timeout), the path stays selectable a few times
+                            key=SolverCache.get_key(new_path)
+                            unknown_tries[key]=unknown_tries.get(key,0)+1
+                            if unknown_tries[key]<MAX_UNKNOWN_TRIES:
+                                continue
                         # If the path is not solvable, try another path
-                        self.cond_tree.update_tree(new_path)
+                        self.cond_tree.update_tree(new_path,executed=False)
             else:
                 # Otherwise, return the buggy values
                 return before_values
@@ -449,6 +523,7 @@ class RepairloopRunner:
 
         save_file.write(f'Local vars:\n')
         print('Compare local variables...')
+        memo=SnapshotMemo()
         for name,obj in local_vars.items():
             if is_default_local(self.fn,name,obj):
                 continue
@@ -456,10 +531,10 @@ class RepairloopRunner:
             if name not in self.local_vars_without_default:
                 is_same=False
                 print(f'New local var {name}: {obj}')
-                save_file.write(f'New local var {name}: {type(obj)}: {pickle_object(self.fn,name,obj)}\n')
+                save_file.write(f'New local var {name}: {type(obj)}: {pickle_object(self.fn,name,obj,pickled_ids=memo)}\n')
                 break
             
-            _obj=pickle_object(self.fn,name,obj)
+            _obj=pickle_object(self.fn,name,obj,pickled_ids=memo)
             if _obj is not None:
                 _is_same=compare_object(_obj,self.local_vars_without_default[name])
                 if is_same:
@@ -478,6 +553,7 @@ class RepairloopRunner:
         if not self.skip_global:
             save_file.write(f'-----------------------\nGlobal vars:\n')
             print('Compare global variables...')
+            memo=SnapshotMemo()
             for name,obj in global_vars.items():
                 if is_default_global(self.fn,name,obj):
                     continue
@@ -485,9 +561,9 @@ class RepairloopRunner:
                 if name not in self.global_vars_without_default:
                     # is_same=False
                     print(f'New global var {name}: {obj}')
-                    save_file.write(f'New global var {name}: {type(obj)}: {pickle_object(self.fn,name,obj,is_global=True)}\n')
+                    save_file.write(f'New global var {name}: {type(obj)}: {pickle_object(self.fn,name,obj,is_global=True,pickled_ids=memo)}\n')
                     break
-                _obj=pickle_object(self.fn,name,obj,is_global=True)
+                _obj=pickle_object(self.fn,name,obj,is_global=True,pickled_ids=memo)
                 if _obj is not None:
                     _is_same=compare_object(_obj,self.global_vars_without_default[name])
                     if is_same:
@@ -514,7 +590,8 @@ class RepairloopRunner:
 def except_handler(e:Exception):
     global is_concolic_execution, use_criu
     if is_concolic_execution:
-        raise
+        # Not raise: the exception hook calls this outside of an except block
+        raise e
     else:
         is_concolic_execution=True
     if use_criu:
@@ -523,9 +600,10 @@ def except_handler(e:Exception):
         if not os.path.exists(f"{filepath}/../../{filename}/"):
             os.mkdir(f"{filepath}/../../criu/{filename}/")
         subprocess.run([f"criu dump --tree {os.getpid()} --images-dir {filepath}/../../{filename}/ --leave-running"])
-    innerframes=inspect.getinnerframes(e.__traceback__)
+    # No source context is needed here, the source comes from the index below
+    innerframes=inspect.getinnerframes(e.__traceback__,context=0)
     innerframes.reverse()
-    outerframes=inspect.getouterframes(e.__traceback__.tb_frame)
+    outerframes=inspect.getouterframes(e.__traceback__.tb_frame,context=0)
     if innerframes[-1]==outerframes[0]:
         total_frames=innerframes[:-2]+outerframes
     else:
@@ -540,31 +618,19 @@ def except_handler(e:Exception):
     print('Exception thrown: ')
     traceback.print_exception(type(e),e,e.__traceback__)
     
-    objects=gc.get_referrers(inner_info.frame.f_code)
-    func=None
-    for obj in objects:
-        if isinstance(obj,FunctionType) and obj.__name__==inner_info.function:
-            func=obj
-            break
+    func=lookup_function(inner_info.frame.f_code,inner_info.frame)
     
     assert func is not None,f'Cannot find function {inner_info.function} at line {inner_info.lineno}'
 
-    with open(inner_info.filename,'r') as file:
-        code=file.read()
-        func_ast=ast.parse(code,inner_info.filename,'exec')
-        lines=code.splitlines()
-
-    visitor=FunctionFinderVisitor(inner_info.lineno)
-    visitor.visit(func_ast)
-    target_func=visitor.get_funcs()
+    index=get_index(inner_info.filename)
+    target_func=index.get_function(inner_info.lineno)
     args=target_func.args
     # print(args.args[0].arg)
     # print(args.posonlyargs)
     # print(args.kwonlyargs[0].arg)
     # print(args.vararg.arg)
 
-    target_lines=lines[target_func.lineno-1:target_func.end_lineno]
-    target_code='\n'.join(target_lines)
+    target_code=index.get_source(target_func)
 
     pos_args=[]
     for arg in args.posonlyargs:
@@ -611,12 +677,15 @@ def except_handler(e:Exception):
     # print(f'Kwargs: {kwonlys}')
     bug_info=BugInformation(inner_info.lineno,inner_info.function,
                             inner_info.frame.f_locals.copy(),inner_info.frame.f_globals.copy())
+    # One memo per namespace, so variables referring to the same object share its snapshot
+    memo=SnapshotMemo()
     for name,obj in prune_default_local_var(func,inner_info.frame.f_locals.copy()).items():
-        _obj=pickle_object(func,name,obj)
+        _obj=pickle_object(func,name,obj,pickled_ids=memo)
         if _obj is not None:
             bug_info.local_vars[name]=_obj
+    memo=SnapshotMemo()
     for name,obj in prune_default_global_var(func,inner_info.frame.f_globals.copy()).items():
-        _obj=pickle_object(func,name,obj,is_global=True)
+        _obj=pickle_object(func,name,obj,is_global=True,pickled_ids=memo)
         if _obj is not None:
             bug_info.global_vars[name]=_obj
     runner=RepairloopRunner(func,pos_only+norms+vargs,kwonlys,bug_info,target_func,target_code)
@@ -628,26 +697,17 @@ def func_entry(glbs:dict):
     global is_concolic_execution,__entry_i
     if is_concolic_execution: return
 
-    outerframes=inspect.getouterframes(inspect.currentframe())
+    outerframes=inspect.getouterframes(inspect.currentframe(),context=0)
     cur_frame=outerframes[1]
 
     if 'FUNC_NAME' not in os.environ: return
     if cur_frame.function!=os.environ['FUNC_NAME']: return
 
-    objects=gc.get_referrers(cur_frame.frame.f_code)
-    func=None
-    for obj in objects:
-        if isinstance(obj,FunctionType) and obj.__name__==cur_frame.function:
-            func=obj
-            break
+    func=lookup_function(cur_frame.frame.f_code,cur_frame.frame)
     
     assert func is not None,f'Cannot find function {cur_frame.function} at line {cur_frame.lineno}'
 
-    with open(cur_frame.filename,'r') as file:
-        func_ast=ast.parse(file.read(),cur_frame.filename,'exec')
-    visitor=FunctionFinderVisitor(cur_frame.lineno)
-    visitor.visit(func_ast)
-    target_func=visitor.get_funcs()
+    target_func=get_index(cur_frame.filename).get_function(cur_frame.lineno)
     args=target_func.args
     # print(args.args[0].arg)
     # print(args.posonlyargs)
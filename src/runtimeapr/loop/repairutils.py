@@ -1,7 +1,9 @@
 import dataclasses
 from types import FunctionType, MethodType, ModuleType
-from typing import Any, Dict, List, Set, Union
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+import hashlib
 import inspect
+import io
 import pickle
 from functools import partial
 
@@ -82,10 +84,46 @@ class PickledObject:
 
         self.type=type(orig_data)
         self.orig_data=orig_data
-        try:
-            self.orig_data_str:str=str(orig_data)
-        except:
-            self.orig_data_str:str=''
+        self._orig_data_str:str=None
+        self.digest:bytes=None    # Content hash of this subtree, set by compute_digest()
+
+    @property
+    def orig_data_str(self) -> str:
+        # str() of large objects is expensive and only needed for printing
+        if self._orig_data_str is None:
+            try:
+                self._orig_data_str=str(self.orig_data)
+            except:
+                self._orig_data_str=''
+        return self._orig_data_str
+    
+    def _new_hash(self,tag:bytes):
+        h=hashlib.blake2b(tag,digest_size=16)
+        h.update(f'{self.type.__module__}.{self.type.__qualname__}'.encode())
+        return h
+
+    def compute_digest(self) -> 'PickledObject':
+        """
+        Computes the digest from the pickled data or the digests of the children, so must be called after the children.
+        Equal digests mean compare_object() returns True; nodes that cannot be hashed keep None.
+        """
+        if self.unpickled!='':
+            # compare_object() only checks the type of unpickled objects
+            self.digest=self._new_hash(b'u').digest()
+        elif isinstance(self.data,bytes) and len(self.data)>0:
+            h=self._new_hash(b'd')
+            h.update(self.data)
+            self.digest=h.digest()
+        elif self.data==b'':
+            h=self._new_hash(b'c')
+            for name in sorted(self.children):
+                child=self.children[name]
+                if child.digest is None:
+                    return self
+                h.update(name.encode('utf-8','surrogatepass')+b'\0')
+                h.update(child.digest)
+            self.digest=h.digest()
+        return self
     
     def __str__(self) -> str:
         if self.data!=b'':
@@ -104,87 +142,184 @@ class SetObject(PickledObject):
         self.type=set
         self.elements:Set[PickledObject]=set()
 
+    def compute_digest(self) -> 'SetObject':
+        digests=[elem.digest for elem in self.elements]
+        if None not in digests:
+            h=self._new_hash(b's')
+            for digest in sorted(digests):
+                h.update(digest)
+            self.digest=h.digest()
+        return self
+
     def __str__(self) -> str:
         return f'{self.name} (set): {self.elements}'
     
-pickle._Pickler.dispatch[zint]=pickle._Pickler.dispatch[int]
-pickle._Pickler.dispatch[zbool]=pickle._Pickler.dispatch[bool]
-pickle._Pickler.dispatch[zstr]=pickle._Pickler.dispatch[str]
-pickle._Pickler.dispatch[zfloat]=pickle._Pickler.dispatch[float]
-pickle.dumps=pickle._dumps
+PROXY_TYPES=(zbool,zint,zstr,zfloat)
+# Pickled by pickle.dumps directly, without a Pickler object
+SCALAR_TYPES=(type(None),bool,int,float,complex,str,bytes)
+
+class ProxyFound(Exception):
+    """Raised by SnapshotPickler at the first concolic proxy, see dumps()."""
+
+class SnapshotPickler(pickle.Pickler):
+    """
+    C pickler for objects without concolic proxies nested in them, the common case.
+    The global pickle module is left untouched.
+    """
+    def reducer_override(self,obj):
+        if type(obj) in PROXY_TYPES:
+            raise ProxyFound()
+        return NotImplemented
+
+class ProxyPickler(pickle._Pickler):
+    """
+    Python pickler that writes concolic proxies nested in other objects as their concrete values,
+    with exactly the bytes the values have without proxies, e.g. dumps([zint(5)])==dumps([5]).
+    """
+    def save(self,obj,save_persistent_id=True):
+        if type(obj) in PROXY_TYPES:
+            obj=obj.v
+        super().save(obj,save_persistent_id)
+
+def dumps(obj) -> bytes:
+    if type(obj) in PROXY_TYPES:
+        obj=obj.v
+    if type(obj) in SCALAR_TYPES:
+        return pickle.dumps(obj)
+    
+    file=io.BytesIO()
+    try:
+        SnapshotPickler(file).dump(obj)
+    except ProxyFound:
+        file=io.BytesIO()
+        ProxyPickler(file).dump(obj)
+    return file.getvalue()
+
+class RefObject(PickledObject):
+    """Reference to an object that is still being snapshotted, i.e. a reference cycle."""
+    def __init__(self,name,target:PickledObject) -> None:
+        super().__init__(name,orig_data=target.orig_data)
+        self.target=target
 
-def pickle_object(fn:FunctionType,name:str,obj:object,is_global=False,pickled_ids:Dict[int,PickledObject]=dict(),recursive=1):
+    def compute_digest(self) -> 'RefObject':
+        # compare_object() only checks the type of references
+        self.digest=self._new_hash(b'r').digest()
+        return self
+
+    def __str__(self) -> str:
+        return f'{self.name} (cycle): {self.target.name}'
+
+class SnapshotMemo:
+    """
+    Identity memo of the variables of one namespace of a snapshot, so containers and user objects referenced
+    more than once share a node. Immutable atoms are not memoized, interned ints and strs are shared by
+    unrelated variables. Nodes are keyed by the depth they were taken at, since max_recursive truncates
+    them relative to it.
+    It keeps the snapshotted objects alive so their ids are not reused while the memo is used.
+    """
+    def __init__(self) -> None:
+        self.nodes:Dict[Tuple[int,int],Tuple[object,PickledObject]]=dict()
+        self.in_progress:Dict[int,PickledObject]=dict()
+
+    def get(self,name:str,obj:object,recursive:int) -> Optional[PickledObject]:
+        if id(obj) in self.in_progress:
+            return RefObject(name,self.in_progress[id(obj)]).compute_digest()
+        if (id(obj),recursive) not in self.nodes:
+            return None
+        return self.nodes[(id(obj),recursive)][1]
+
+    def start(self,obj:object,node:PickledObject):
+        self.in_progress[id(obj)]=node
+
+    def finish(self,obj:object,node:PickledObject,recursive:int) -> PickledObject:
+        self.nodes[(id(obj),recursive)]=(obj,node)
+        self.in_progress.pop(id(obj),None)
+        return node.compute_digest()
+
+def pickle_object(fn:FunctionType,name:str,obj:object,is_global=False,pickled_ids:Optional[SnapshotMemo]=None,recursive=1):
+    """
+    Snapshots obj into a tree of PickledObject.
+    :param pickled_ids: memo shared by the variables of one snapshot, a new one is used if None
+    """
+    if pickled_ids is None:
+        pickled_ids=SnapshotMemo()
     if recursive>Configure.max_recursive:
-        return PickledObject(name,unpickled=f'recursive limit: {id(obj)}')
+        return PickledObject(name,unpickled=f'recursive limit: {id(obj)}').compute_digest()
     
-    if type(obj) in (zbool,zint,zstr,zfloat):
-        res=PickledObject(name,pickle.dumps(obj.v),obj.v)
-        pickled_ids[id(obj.v)]=res
-        return res
-    elif isinstance(obj,set):
+    if type(obj) in PROXY_TYPES:
+        return PickledObject(name,dumps(obj.v),obj.v).compute_digest()
+    elif type(obj) in SCALAR_TYPES:
+        return PickledObject(name,dumps(obj),obj).compute_digest()
+
+    memoized=pickled_ids.get(name,obj,recursive)
+    if memoized is not None:
+        return memoized
+
+    if isinstance(obj,set):
         # Set object
         pickled_obj=SetObject(name,obj)
+        pickled_ids.start(obj,pickled_obj)
         new_set=set()
         for i,elem in enumerate(list(obj)):
             new_set.add(pickle_object(fn,str(i),elem,is_global=is_global,pickled_ids=pickled_ids,recursive=recursive+1))
         pickled_obj.elements=new_set
-        pickled_ids[id(obj)]=pickled_obj
-        return pickled_obj
+        return pickled_ids.finish(obj,pickled_obj,recursive)
     elif isinstance(obj,list) or isinstance(obj,tuple):
         pickled_obj=PickledObject(name,orig_data=obj)
+        pickled_ids.start(obj,pickled_obj)
         for i,elem in enumerate(obj):
             pickled_obj.children[str(i)]=pickle_object(fn,str(i),elem,is_global=is_global,pickled_ids=pickled_ids,recursive=recursive+1)
-        pickled_ids[id(obj)]=pickled_obj
-        return pickled_obj
+        return pickled_ids.finish(obj,pickled_obj,recursive)
     elif isinstance(obj,dict):
         pickled_obj=PickledObject(name,orig_data=obj)
+        pickled_ids.start(obj,pickled_obj)
         for key,value in obj.items():
             pickled_obj.children[str(key)]=pickle_object(fn,str(key),value,is_global=is_global,pickled_ids=pickled_ids,recursive=recursive+1)
-        pickled_ids[id(obj)]=pickled_obj
-        return pickled_obj
+        return pickled_ids.finish(obj,pickled_obj,recursive)
     elif hasattr(obj,'__dict__'):
         # Convert object recursively
         try:
             pickled_obj=PickledObject(name,orig_data=obj)
+            pickled_ids.start(obj,pickled_obj)
             for attr in dir(obj):
                 try:
-                    if (is_global and is_default_global(fn,attr,getattr(obj,attr))) or \
-                            (not is_global and is_default_local(fn,attr,getattr(obj,attr))):
+                    attr_value=getattr(obj,attr)
+                    if (is_global and is_default_global(fn,attr,attr_value)) or \
+                            (not is_global and is_default_local(fn,attr,attr_value)):
                         continue
                     else:
-                        attr_obj=pickle_object(fn,attr,getattr(obj,attr),is_global=is_global,pickled_ids=pickled_ids,recursive=recursive+1)
-                        pickled_ids[id(getattr(obj,attr))]=attr_obj
+                        attr_obj=pickle_object(fn,attr,attr_value,is_global=is_global,pickled_ids=pickled_ids,recursive=recursive+1)
                         if attr_obj is not None:
                             pickled_obj.children[attr]=attr_obj
                 except Exception as e:
                     print(f'Error when pickling {attr}: {e}, skip!')
 
-            pickled_ids[id(obj)]=pickled_obj
-            return pickled_obj
+            return pickled_ids.finish(obj,pickled_obj,recursive)
         except Exception as e:
             # ctypes objects cannot be pickled, use object directly
-            return PickledObject(name,orig_data=obj,unpickled=f'{type(e)}: {e}')
+            return pickled_ids.finish(obj,PickledObject(name,orig_data=obj,unpickled=f'{type(e)}: {e}'),recursive)
     else:
         try:
-            data=pickle.dumps(obj)
-            res=PickledObject(name,data,obj)
-            pickled_ids[id(obj)]=res
-            return res
+            data=dumps(obj)
+            return pickled_ids.finish(obj,PickledObject(name,data,obj),recursive)
         except Exception as e:
             # ctypes objects cannot be pickled, use object directly
-            return PickledObject(name,orig_data=obj,unpickled=f'{type(e)}: {e}')
+            return pickled_ids.finish(obj,PickledObject(name,orig_data=obj,unpickled=f'{type(e)}: {e}'),recursive)
         
 FLOAT_THRESHOLD=0.01
 
 def compare_object(a:PickledObject,b:PickledObject):
-    if a.type==partial and b.type==partial:
+    if a.digest is not None and a.digest==b.digest:
+        # Same content, no need to descend into children
+        return True
+    elif a.type==partial and b.type==partial:
         # functools.partial is same as function
         return True
     elif a.type==float and b.type==float:
         # Same if they are close enough
         return abs(pickle.loads(a.data)-pickle.loads(b.data))<FLOAT_THRESHOLD
-    elif a.unpickled!='' or b.unpickled!='':
-        # Just check type if one of them cannot pickled
+    elif a.unpickled!='' or b.unpickled!='' or isinstance(a,RefObject) or isinstance(b,RefObject):
+        # Just check type if one of them cannot pickled or refers back to a parent
         return a.type==b.type
     elif isinstance(a,SetObject) and isinstance(b,SetObject):
         if len(a.elements)!=len(b.elements):
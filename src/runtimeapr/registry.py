@@ -0,0 +1,85 @@
+"""Maps code objects to the functions that run them, without scanning the heap."""
+import gc
+import weakref
+from types import CodeType, FrameType, FunctionType
+from typing import Dict, Iterable, List, Optional
+
+functions: Dict[int, weakref.ref] = dict()  # id(func.__code__) -> weakref to func
+namespaces: List[dict] = []  # Globals of instrumented modules and scripts, see add_namespace()
+
+
+def register(func: FunctionType):
+    key = id(func.__code__)
+
+    def remove(ref):
+        if functions.get(key) is ref:
+            del functions[key]
+
+    functions[key] = weakref.ref(func, remove)
+
+
+def register_all(items: Iterable, module_name: Optional[str] = None):
+    """
+    Registers functions, methods of classes, and static/class methods in items.
+    If module_name is given, only the functions and classes defined in that module, not the ones it imports.
+    """
+    from .slipcover import Slipcover
+
+    if module_name is not None:
+        items = [obj for obj in items if isinstance(obj, (FunctionType, type)) and obj.__module__ == module_name]
+    for func in Slipcover.find_functions(list(items), set()):
+        register(func)
+
+
+def add_namespace(namespace: dict):
+    """
+    Adds the globals of an instrumented module or script before it runs.
+    Its functions are registered after it runs, or when lookup() misses while it is still running.
+    """
+    namespaces.append(namespace)
+
+
+def register_namespace(namespace: dict):
+    register_all(namespace.values(), namespace.get('__name__'))
+
+
+def _get(code: CodeType) -> Optional[FunctionType]:
+    ref = functions.get(id(code))
+    func = ref() if ref is not None else None
+    # ids are reused after objects are freed, and __code__ may have been replaced
+    if func is not None and func.__code__ is code:
+        return func
+    return None
+
+
+def lookup(code: CodeType, frame: Optional[FrameType] = None) -> Optional[FunctionType]:
+    """
+    Returns a function whose __code__ is code.
+    Registered functions are found in O(1). Otherwise the globals of frame and of the namespaces added with
+    add_namespace() (functions and methods of the modules), then the locals of the callers of frame (closures)
+    are registered, and gc.get_referrers is used as the last resort.
+    """
+    func = _get(code)
+    if func is not None:
+        return func
+
+    for namespace in ([frame.f_globals] if frame is not None else []) + namespaces:
+        register_namespace(namespace)
+        func = _get(code)
+        if func is not None:
+            return func
+
+    if frame is not None:
+        outer = frame.f_back
+        while outer is not None:
+            register_all(outer.f_locals.values())
+            func = _get(code)
+            if func is not None:
+                return func
+            outer = outer.f_back
+
+    for obj in gc.get_referrers(code):
+        if isinstance(obj, FunctionType) and obj.__code__ is code:
+            register(obj)
+            return obj
+    return None
@@ -0,0 +1,79 @@
+import ast
+import bisect
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+FunctionNode = Union[ast.FunctionDef, ast.AsyncFunctionDef]
+
+
+class SourceIndex:
+    """
+    Parsed source of a file, shared by the repair loop and the graphs built from it.
+
+    Functions that are not nested in other functions are indexed by their line ranges,
+    so the function containing a line is found without walking the AST.
+    """
+
+    def __init__(self, filename: str, source: str):
+        self.filename = filename
+        self.source = source
+        self.lines = source.splitlines()
+        self.tree: ast.Module = ast.parse(source, filename, 'exec')
+        self._gast_tree = None
+        self.cache: Dict[str, Any] = dict()  # Other data derived from this source, e.g. def-use chains
+
+        # (first line including decorators, last line, node), sorted by first line
+        self.functions: List[Tuple[int, int, FunctionNode]] = []
+        self._collect_functions(self.tree)
+        self.functions.sort(key=lambda f: f[0])
+        self._starts = [f[0] for f in self.functions]
+
+    def _collect_functions(self, node: ast.AST):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                start = child.decorator_list[0].lineno if child.decorator_list else child.lineno
+                self.functions.append((start, child.end_lineno, child))
+            else:
+                self._collect_functions(child)
+
+    @property
+    def gast_tree(self):
+        if self._gast_tree is None:
+            import gast
+
+            self._gast_tree = gast.ast_to_gast(ast.parse(self.source, self.filename, 'exec'))
+        return self._gast_tree
+
+    def get_function(self, lineno: int) -> Optional[FunctionNode]:
+        """Returns the outermost function (or method) that contains lineno, same as FunctionFinderVisitor."""
+        i = bisect.bisect_right(self._starts, lineno) - 1
+        if i >= 0:
+            start, end, node = self.functions[i]
+            if start <= lineno <= end:
+                return node
+        return None
+
+    def get_source(self, node: ast.AST) -> str:
+        return '\n'.join(self.lines[node.lineno - 1 : node.end_lineno])
+
+    def get_cached(self, name: str, factory: Callable[[], Any]) -> Any:
+        if name not in self.cache:
+            self.cache[name] = factory()
+        return self.cache[name]
+
+
+indexes: Dict[str, Tuple[Tuple[int, int], SourceIndex]] = dict()  # filename -> ((mtime, size), index)
+
+
+def get_index(filename: str) -> SourceIndex:
+    """Returns the SourceIndex of filename, parsing it again only if its mtime or size changed."""
+    stat = os.stat(filename)
+    key = (stat.st_mtime_ns, stat.st_size)
+    entry = indexes.get(filename)
+    if entry is not None and entry[0] == key:
+        return entry[1]
+
+    with open(filename, 'r') as f:
+        index = SourceIndex(filename, f.read())
+    indexes[filename] = (key, index)
+    return index
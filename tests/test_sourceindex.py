@@ -0,0 +1,60 @@
+import textwrap
+
+import pytest
+
+from runtimeapr.sourceindex import SourceIndex, get_index
+
+SOURCE = textwrap.dedent(
+    '''\
+    from functools import lru_cache
+
+
+    @lru_cache(
+        maxsize=None,
+    )
+    def fib(n):
+        if n < 2:
+            return n
+        return fib(n - 1) + fib(n - 2)
+
+
+    def after(x):
+        return x
+    '''
+)
+
+
+@pytest.fixture
+def decorated(tmp_path):
+    filename = str(tmp_path / 'decorated.py')
+    with open(filename, 'w') as f:
+        f.write(SOURCE)
+    namespace = dict()
+    exec(compile(SOURCE, filename, 'exec'), namespace)
+    return filename, namespace
+
+
+def test_get_function_multiline_decorator(decorated):
+    filename, namespace = decorated
+    index = SourceIndex(filename, SOURCE)
+    code = namespace['fib'].__wrapped__.__code__
+
+    assert code.co_firstlineno == 4
+    for lineno in range(code.co_firstlineno, 11):
+        assert index.get_function(lineno).name == 'fib'
+    assert index.get_function(3) is None
+    assert index.get_function(13).name == 'after'
+
+
+def test_get_function_cfg_multiline_decorator(decorated):
+    pytest.importorskip('runtimeapr.loop')  # Imports runtimeapr.concolic, which needs the loop first
+    from runtimeapr.concolic.cfg import find_function_node, get_function_cfg
+
+    filename, namespace = decorated
+    fn = namespace['fib'].__wrapped__
+    index = get_index(filename)
+    node = find_function_node(index, fn.__code__.co_firstlineno, 'fib')
+
+    assert node is not None and node.name == 'fib'
+    get_function_cfg(fn)
+    assert 'cfg' not in index.cache  # Built from the node, not searched in the CFG of the whole file